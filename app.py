@@ -1,24 +1,51 @@
+import os
+
+# 'eventlet' or 'gevent' serves all clients & the simulation from greenlets on a single thread (package must be installed)
+ASYNC_MODE = os.environ.get('ASYNC_MODE', 'threading')
+# blocking calls (the journal's sqlite writes) go to a pool of real OS threads there, so that they don't stall the other greenlets
+run_blocking = None
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+    from eventlet import tpool
+    run_blocking = tpool.execute
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+    from gevent import get_hub
+    run_blocking = lambda fn, *args: get_hub().threadpool.apply(fn, args)
+
 from utils import *
-from gen_prices import genPrices
+from seperate_assets import write_summary
+from engine import hooks, orderMatch_sim, place, cancel, amend, orders_of
 from user import users
+from scheduler import Scheduler
 
-import random
-import time
-from datetime import timedelta
-
-from flask import Flask, render_template, redirect, request, url_for, flash, session
+from flask import Flask, render_template, redirect, request, url_for, flash, session, jsonify, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from flask_socketio import SocketIO
-from sqlalchemy.exc import IntegrityError
+from flask_socketio import SocketIO, join_room, leave_room, rooms
+from journal import TradeJournal, configure_sqlite
+from publisher import Outbox, book_diff
+from shard import ShardPool
+from floorsheet import floorsheet_indexes, create_indexes, add_columns, filtered, page, page_args, export_csv
+from settlement import Settlement
+from candles import Candles, INTERVALS
 
 
 # App setups
 print("Configuring App & DB setups ...")
 app = Flask(__name__)
-socketio = SocketIO(app)
+socketio = SocketIO(app, async_mode=ASYNC_MODE)
 
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///database.db"
+app.config["SQLITE_JOURNAL_MODE"] = "WAL" # lets readers run alongside the trade writer
+app.config["SQLITE_SYNCHRONOUS"] = "NORMAL" # fsync at checkpoints only (use FULL for fsync on every commit)
+app.config["JOURNAL_BATCH_SIZE"] = 500 # max. trades written per commit
+app.config["JOURNAL_FLUSH_MS"] = 50 # max. time a trade waits before being committed
+app.config["OUTBOX_FRAME_MS"] = 50 # order book, ticker & placed orders updates are coalesced over this time
+app.config["SHARDS"] = int(os.environ.get('SHARDS', 0)) # no. of worker processes simulating the assets (0 simulates them in this process)
 db = SQLAlchemy(app)
+configure_sqlite(app, db)
 
 app.secret_key = 'your_secret_key'  # Change this to a secure random string
 
@@ -34,6 +61,10 @@ class PriceRow(db.Model):
     buyerName = db.Column(db.String(100))
     sellerName = db.Column(db.String(100))
     symbol = db.Column(db.String(10))
+    # simulated time of the trade (epoch sec)
+    time = db.Column(db.Float)
+
+    __table_args__ = floorsheet_indexes()
     
     def __repr__(self):
         return f'<Task {self.id}>'
@@ -49,389 +80,193 @@ class PriceRow(db.Model):
             'rate': self.rate,
             'buyerName': self.buyerName,
             'sellerName': self.sellerName,
-            'symbol': self.symbol
+            'symbol': self.symbol,
+            'time': self.time
         }
 
 
 event_firstEmit = threading.Event()
-lock_start = threading.Lock()
-lock_db = threading.Lock()
-lock_emit = threading.Lock()
+lock_floorsheet = threading.Lock()
 
+# sequence no. of the last floorsheet delta, lets clients detect missed deltas
+floorsheetSeq = 0
+# max. rows sent in a single floorsheet catch-up page
+FLOORSHEET_PAGE_SIZE = 500
 
-def genConID(rem_mkt_order):
-    global placedOrders
 
-    if rem_mkt_order == True:
-        placedOrders.append([None])
+def emit_floorsheet(rows):
+    # push only the newly inserted rows instead of the whole table
+    global floorsheetSeq
+    with lock_floorsheet:
+        floorsheetSeq += 1
+        socketio.emit('floorsheet', {'rows': rows, 'seq': floorsheetSeq})
 
-    return datecode + '1' + '0' * (7 - len(str(Orders))) + str(Orders)
 
-def MKT_execute(obj):
-    global placedOrders
-    i = MKT_Orders[0] # grab order id of this order
+# Socket.IO room of the clients viewing a symbol, only they receive its full order book
+def symbol_room(sym):
+    return 'sym:' + sym
 
-    # Order ready to be filled
-    if placedOrders[i-1][6] == False:
-        placedOrders[i-1][6] = True
-        socketio.emit('placed_orders', {'placedOrders': placedOrders})
 
-    # When the best bid/ask qty < mkt order's qty
-    if (placedOrders[i-1][4] >= obj.sellOB[0][1] and placedOrders[i-1][5] == 'Buy') or (placedOrders[i-1][4] >= obj.buyOB[0][1] and placedOrders[i-1][5] == 'Sell'):
-        # Update LTP & deduct collateral
-        if placedOrders[i-1][5] == 'Buy':
-            socketio.emit('order_book', {'ltp': obj.sellOB[0][2], 'sym': placedOrders[i-1][1]})
-            socketio.emit('deduct_req', {'amt': obj.sellOB[0][2] * obj.sellOB[0][1]})
-        else:
-            socketio.emit('order_book', {'ltp': obj.buyOB[0][2], 'sym': placedOrders[i-1][1]})
-
-        # Add data to database
-        with app.app_context():
-            try:
-                global Orders
-                rand = random.choice(obj.arr)
-                if placedOrders[i-1][5] == 'Buy':
-                    if placedOrders[i-1][2] == placedOrders[i-1][4]:
-                        new_row = PriceRow(conID=genConID(False), buyerID=100, sellerID=rand[3], qty=obj.sellOB[0][1], rate=obj.sellOB[0][2], buyerName=placedOrders[i-1][8], sellerName=rand[8], symbol=obj.arr[0][9])
-                    else:
-                        Orders += 1
-                        new_row = PriceRow(conID=genConID(True), buyerID=100, sellerID=rand[3], qty=obj.sellOB[0][1], rate=obj.sellOB[0][2], buyerName=placedOrders[i-1][8], sellerName=rand[8], symbol=obj.arr[0][9])
-                else:
-                    if placedOrders[i-1][2] == placedOrders[i-1][4]:
-                        new_row = PriceRow(conID=genConID(False), buyerID=rand[2], sellerID=100, qty=obj.buyOB[0][1], rate=obj.buyOB[0][2], buyerName=rand[7], sellerName=placedOrders[i-1][8], symbol=obj.arr[0][9])
-                    else:
-                        Orders += 1
-                        new_row = PriceRow(conID=genConID(True), buyerID=rand[2], sellerID=100, qty=obj.buyOB[0][1], rate=obj.buyOB[0][2], buyerName=rand[7], sellerName=placedOrders[i-1][8], symbol=obj.arr[0][9])
-                db.session.add(new_row)
-                db.session.commit()
-            except IntegrityError:
-                db.session.rollback()  # Rollback in case of error
-            tranData = PriceRow.query.order_by(PriceRow.id).all()
-            tranDataDict = [row.to_dict() for row in tranData] # Convert data to a list of dictionaries
-            socketio.emit('floorsheet', {'database': tranDataDict})
-
-        # remaining orders to get filled
-        if placedOrders[i-1][5] == 'Buy':
-            placedOrders[i-1][4] -= obj.sellOB[0][1]
-        else:
-            placedOrders[i-1][4] -= obj.buyOB[0][1]
-        socketio.emit('placed_orders', {'placedOrders': placedOrders})
+# Socket.IO room of all clients of a logged in user
+def user_room(username):
+    return 'user:' + username
+
+
+# frequent updates are held back and only the latest of each frame is sent
+outbox = Outbox(socketio, app.config["OUTBOX_FRAME_MS"])
+
+
+# LTP of every asset goes to all clients, but only when it changes
+def emit_ticker(obj, ltp):
+    if ltp != obj.ltp:
+        obj.ltp = ltp
+        sym = obj.symbol
+        outbox.post(('ticker', sym), lambda: [('ticker', {'ltp': ltp, 'sym': sym}, None)])
+
+
+# orders placed by a user (copied, as the sim keeps updating them)
+def user_orders(username):
+    orders = orders_of(username)
+    for rows in remoteOrders.get(username, {}).values():
+        orders += rows
+    return orders
+
+
+# a user's order by its OrderNo (None if there is no such order of the user)
+def user_order(username, OrderNo):
+    order = placedOrders.get(OrderNo)
+    if order is not None:
+        return order if order[7] == username else None
+    for rows in remoteOrders.get(username, {}).values():
+        for order in rows:
+            if order[0] == OrderNo:
+                return order
+    return None
+
+
+# shares & collateral given back to a user (cancelled or amended order), pushed to all of the user's clients
+def refund(username, sym, qty, amt):
+    user = users.get(username)
+    user.balance[sym] = user.balance.get(sym, 0) + qty
+    user.collateral += amt
+    socketio.emit('user_info', {'balance': user.balance, 'collateral': user.collateral}, room=user_room(username))
+
+
+# collateral taken from a user for a filled market buy, pushed to all of the user's clients
+def deduct(username, amt):
+    user = users.get(username)
+    user.collateral -= amt
+    socketio.emit('user_info', {'collateral': user.collateral}, room=user_room(username))
+
+
+# OrderNos of the orders whose cancellation was accepted, no more cancel/amend requests are taken for them
+cancelling = set()
+lock_cancel = threading.Lock()
+
+
+def emit_placed_orders(username):
+    outbox.post(('placed_orders', username), lambda: [('placed_orders', {'placedOrders': user_orders(username)}, user_room(username))])
+
 
-        if placedOrders[i-1][4] == 0: # when all qty is filled
-            del MKT_Orders[0]
+def book_snapshot(obj):
+    seq, book = obj.publishedOB
+    return {'sym': obj.symbol, 'seq': seq, 'sellOB': book[0], 'buyOB': book[1]}
 
-    # When the best bid/ask qty > mkt order's qty
+
+# send the asset's current order book to its room (at the end of the frame)
+def emit_order_book(obj):
+    sym = obj.symbol
+    book = ([list(level) for level in obj.sellOB], [list(level) for level in obj.buyOB]) # levels get modified in place later
+    outbox.post(('order_book', sym), lambda: order_book_update(obj, sym, book))
+
+
+# the book as a delta against the previously sent one
+def order_book_update(obj, sym, book):
+    seq, sent = obj.publishedOB
+    sellDiff, sellDel = book_diff(sent[0], book[0])
+    buyDiff, buyDel = book_diff(sent[1], book[1])
+    if not sellDiff and not sellDel and not buyDiff and not buyDel:
+        return [] # nothing changed
+
+    seq += 1
+    obj.publishedOB = (seq, book)
+    if (seq - 1) % BOOK_SNAPSHOT_EVERY == 0:
+        data = {'sym': sym, 'seq': seq, 'sellOB': book[0], 'buyOB': book[1]}
     else:
-        # update the top bid/ask
-        topAskBid = obj.sellOB if placedOrders[i-1][5] == 'Buy' else obj.buyOB
-        topAskBid[0][0] = int(topAskBid[0][0] * (1 - (placedOrders[i-1][4] / topAskBid[0][1]))) if topAskBid[0][0] > 1 else topAskBid[0][0]
-        topAskBid[0][1] -= placedOrders[i-1][4]
-        if placedOrders[i-1][5] == 'Buy':
-            socketio.emit('order_book', {'sellOB': topAskBid, 'ltp': topAskBid[0][2], 'sym': placedOrders[i-1][1]})
-            socketio.emit('deduct_req', {'amt': obj.sellOB[0][2] * obj.sellOB[0][1]})
-        else:
-            socketio.emit('order_book', {'buyOB': topAskBid, 'ltp': topAskBid[0][2], 'sym': placedOrders[i-1][1]})
-
-        # Add data to database
-        with app.app_context():
-            try:
-                rand = random.choice(obj.arr)
-                if placedOrders[i-1][5] == 'Buy':
-                    if placedOrders[i-1][2] == placedOrders[i-1][4]:
-                        new_row = PriceRow(conID=genConID(False), buyerID=100, sellerID=rand[3], qty=placedOrders[i-1][4], rate=obj.sellOB[0][2], buyerName=placedOrders[i-1][8], sellerName=rand[8], symbol=obj.arr[0][9])
-                    else:
-                        Orders += 1
-                        new_row = PriceRow(conID=genConID(True), buyerID=100, sellerID=rand[3], qty=placedOrders[i-1][4], rate=obj.sellOB[0][2], buyerName=placedOrders[i-1][8], sellerName=rand[8], symbol=obj.arr[0][9])
-                else:
-                    if placedOrders[i-1][2] == placedOrders[i-1][4]:
-                        new_row = PriceRow(conID=genConID(False), buyerID=rand[2], sellerID=100, qty=placedOrders[i-1][4], rate=obj.buyOB[0][2], buyerName=rand[7], sellerName=placedOrders[i-1][8], symbol=obj.arr[0][9])
-                    else:
-                        Orders += 1
-                        new_row = PriceRow(conID=genConID(True), buyerID=rand[2], sellerID=100, qty=placedOrders[i-1][4], rate=obj.buyOB[0][2], buyerName=rand[7], sellerName=placedOrders[i-1][8], symbol=obj.arr[0][9])
-                db.session.add(new_row)
-                db.session.commit()
-            except IntegrityError:
-                db.session.rollback()  # Rollback in case of error
-            tranData = PriceRow.query.order_by(PriceRow.id).all()
-            tranDataDict = [row.to_dict() for row in tranData] # Convert data to a list of dictionaries
-            socketio.emit('floorsheet', {'database': tranDataDict})
-
-        # all qty filled
-        placedOrders[i-1][4] = 0
-        socketio.emit('placed_orders', {'placedOrders': placedOrders})
-        del MKT_Orders[0]
-
-
-def orderMatch_sim(obj):
-
-    def genOB(rate):
-        # top bid & ask prices in order book
-        bidPrices = []; askPrices = []
-        bidPrices = genPrices(rate, 'bids', obj.prices)
-        askPrices = genPrices(rate, 'asks', obj.prices)
-
-        # generating asks order book
-        for i in range(0, TOP_BIDSASKS_NO): # filling each row in order book
-            obj.sellOB.append([0, 0, askPrices[i]]) # initializing row data: [orders, qty, price]
-            brokers = [] # collects all the brokers in the list for that particular price
-            if(i == 0):
-                idx = 0
-                while(idx < len(obj.arr) and obj.arr[idx][5] == obj.sellOB[i][2]):
-                    idx += 1
-                idx -= 1
-                if(idx != -1):
-                    for x in obj.queue:
-                        count = -1
-                        for y in x:
-                            if(obj.sellOB[i][2] == y[5]):
-                                obj.sellOB[i][1] += y[4]
-                                brokers.append(y[3])
-                                count += 1
-                                if(count == idx):
-                                    break
-                        if(obj.sellOB[i][1] != 0):
-                            break
-            else:
-                for x in obj.queue:
-                    for y in x:
-                        if(obj.sellOB[i][2] == y[5]): # to find orders data realted to current price in queue
-                            obj.sellOB[i][1] += y[4] # fetching qty and adding
-                            brokers.append(y[3]) # append all brokers
-                        else:
-                            break
-                    if(obj.sellOB[i][1] != 0):
-                        break
-            if(len(brokers) == 0):
-                obj.sellOB[i][1] = int(random.triangular(10, 1300, 200)) # random qty between 10-1300, mostly being of 100-300
-                obj.sellOB[i][0] = int(random.triangular(1, 20, 7)) # random qty between 1-20, mostly being around 7
-            else:
-                obj.sellOB[i][0] = len(obj.remove_duplicates(brokers)) # total orders
-        
-        # generating bids order book
-        for i in range(0, TOP_BIDSASKS_NO):
-            obj.buyOB.append([0, 0, bidPrices[i]])
-            brokers = []
-            for x in obj.queue:
-                for y in x:
-                    if(obj.buyOB[i][2] == y[5]):
-                        obj.buyOB[i][1] += y[4]
-                        brokers.append(y[2])
-                    else:
-                        break
-                if(obj.buyOB[i][1] != 0):
-                    break
-            if(len(brokers) == 0):
-                obj.buyOB[i][1] = int(random.triangular(10, 1300, 200))
-                obj.buyOB[i][0] = int(random.triangular(1, 20, 7))
-            else:
-                obj.buyOB[i][0] = len(obj.remove_duplicates(brokers))
+        data = {'sym': sym, 'seq': seq, 'sellDiff': sellDiff, 'sellDel': sellDel, 'buyDiff': buyDiff, 'buyDel': buyDel}
+    return [('order_book', data, symbol_room(sym))]
 
-        
-        with lock_emit:
-            if obj.mkt_ex_mode == False:
-                socketio.emit('order_book', {'sellOB': obj.sellOB, 'buyOB': obj.buyOB, 'ltp': obj.arr[0][5], 'sym': obj.arr[0][9]})
-            else:
-                socketio.emit('order_book', {'sellOB': obj.sellOB, 'buyOB': obj.buyOB, 'sym': obj.arr[0][9]})
-
-    def linear_price():
-        if len(obj.arr) > 1:
-            price_diff = round(obj.arr[1][5] - obj.arr[0][5], 1)
-            if abs(price_diff) > 0.3:
-                factor = abs(price_diff)*10 - 1
-                i = 1 if price_diff>0 else -1
-
-                time_diff = obj.arr[1][6] - obj.arr[0][6]
-                time_diff = time_diff.total_seconds()
-
-                def next_rate(i):
-                    return round(obj.arr[0][5] + 0.1*i, 1)
-                
-                while True:
-                    flag = 0
-                    while next_rate(i) != obj.arr[1][5]:
-                        for price in obj.prices:
-                            if price == next_rate(i):
-                                i = i+1 if i>0 else i-1
-                                flag = 1
-                                factor += 1
-                                break
-                        if(flag == 0):
-                            break
-                        flag = 0
-                    if next_rate(i) == obj.arr[1][5]:
-                        break
-                    obj.sellOB.clear()
-                    obj.buyOB.clear()
-                    # print("--------------------------------")
-                    genOB(next_rate(i))
-                    i = i+1 if i>0 else i-1
-
-                    # if there are open market orders of this symbol
-                    if len(MKT_Orders) != 0 and placedOrders[MKT_Orders[0] - 1][1] == obj.arr[0][9]:
-                        MKT_execute(obj)
-                        obj.mkt_ex_mode = True
-
-                    else:
-                        if obj.subThreads > 0 or obj.mkt_ex_mode == True:
-                            if time_diff/factor > 1:
-                                time.sleep(1)
-                            else:
-                                time.sleep(time_diff/factor)
-                        else:
-                            if time_diff/factor > 2:
-                                time.sleep(time_diff/factor)
-                            else:
-                                time.sleep(2)
-                obj.mkt_ex_mode = False
-
-    def matchOrder():
-        if obj.buyOB[0][2] == obj.sellOB[0][2]: # when top bid & ask price match
-            for idx, x in enumerate(obj.queue):
-                for y in x:
-                    if obj.buyOB[0][2] == y[5]:
-                        # Add data to database
-                        with lock_db:
-                            with app.app_context():
-                                try:
-                                    new_row = PriceRow(conID=y[1], buyerID=y[2], sellerID=y[3], qty=y[4], rate=y[5], buyerName=y[7], sellerName=y[8], symbol=y[9])
-                                    db.session.add(new_row)
-                                    db.session.commit()
-                                except IntegrityError:
-                                    db.session.rollback()  # Rollback in case of error
-                                    
-                                if obj.arr[0][9] == symbol:
-                                    tranData = PriceRow.query.order_by(PriceRow.id).all()
-                                    tranDataDict = [row.to_dict() for row in tranData] # Convert data to a list of dictionaries
-                                    socketio.emit('floorsheet', {'database': tranDataDict})
-                            
-                        # if a LMT order matches
-                        if y[1][8:9] == '1':
-                            global placedOrders
-                            for indx in range(9, 16):
-                                if y[1][indx] != '0':
-                                    placedOrders[int(y[1][indx:])-1][4] = 0
-                                    socketio.emit('placed_orders', {'placedOrders': placedOrders})
-
-                        linear_price()
-
-                        del obj.queue[idx][0] # delete first order of that price
-                        if len(obj.queue[idx]) == 0: # if orders in that price is empty
-                            del obj.queue[idx] # delete that element of queue
-                            del obj.prices[idx] # delete that particular price from prices list
-                        del obj.arr[0]
-                        return
-                    else:
-                        break
 
-    
-    with lock_start:
-        event_firstEmit.wait()
-        socketio.emit('stock_list', {'ltp': obj.arr[0][5], 'sym': obj.arr[0][9], 'scripName': obj.name, 'prevClose': obj.prevClose})
-
-        if obj.arr[0][9] == symbol: # for default asset to display
-                socketio.emit('display_asset', {'sym': symbol})
-
-    sym = obj.arr[0][9]
-    while len(obj.arr) != 0:
-        genOB(obj.arr[0][5])
-        matchOrder()
-        obj.sellOB.clear()
-        obj.buyOB.clear()
-        if obj.subThreads > 0:
-            obj.event_start_subThread.set()
-            obj.event_place_LMT.wait()
-
-            obj.event_start_subThread.clear()
-            obj.event_place_LMT.clear()
-    print(sym, "Finished matching")
-    socketio.emit('finished_matching', {'sym': sym})
-
-
-def LMT_place(Rate, Qty, OrderNo, type, key):
-    OrderData = []
-    
-    def genTime(idx):
-        if idx-1 < 0:
-            return assets[key].arr[idx][6] + timedelta(microseconds=-1)
-        if idx+1 == len(assets[key].arr):
-            return assets[key].arr[idx][6] + timedelta(microseconds=1)
-        else:
-            return assets[key].arr[idx-1][6] + (assets[key].arr[idx][6] - assets[key].arr[idx-1][6]) / 2
+# single event loop replaying all assets, at SIM_SPEED times real-time
+scheduler = Scheduler(SIM_SPEED, socketio.sleep)
 
-    def write_orderData():
-        nonlocal OrderData
-        rand = random.choice(assets[key].arr)
-        if type == 'Buy':
-            OrderData = ['', genConID(False), 100, rand[3], Qty, Rate, genTime(idx), placedOrders[OrderNo-1][8], rand[8], assets[key].arr[0][9]]
-        else:
-            OrderData = ['', genConID(False), rand[2], 100, Qty, Rate, genTime(idx), rand[7], placedOrders[OrderNo-1][8], assets[key].arr[0][9]]
-
-    def in_the_end():
-        global placedOrders
-        placedOrders[OrderNo-1][6] = True
-        socketio.emit('placed_orders', {'placedOrders': placedOrders})
-        assets[key].subThreads -= 1
-        if assets[key].subThreads == 0:
-            assets[key].event_place_LMT.set()
-            assets[key].skip = False
-        else:
-            assets[key].skip = True
 
-    with lock_orderPlacing[key]:
-        if assets[key].skip == False:
-            assets[key].event_start_subThread.wait() # wait for main-thread to check if orders have matched before overwriting the new order to the data structure
-        
-        compare = (lambda x, y: x < y) if type == 'Buy' else (lambda x, y: x > y)
-        for idx, next in enumerate(assets[key].arr):
-            if compare(next[5], Rate):
-                write_orderData()
-                assets[key].arr.insert(idx, OrderData)
-                encounter = False
-                for i, price in enumerate(assets[key].prices):
-                    if price == Rate:
-                        assets[key].queue[i].insert(0, OrderData)
-                        encounter = True
-                        break
-                    elif price > Rate:
-                        assets[key].prices.insert(i, Rate)
-                        assets[key].queue.insert(i, [OrderData])
-                        encounter = True
-                        break
-                if encounter == False:
-                    assets[key].prices.append(Rate)
-                    assets[key].queue.append([OrderData])
-                in_the_end()
-                return
-
-            elif next[5] == Rate:
-                count = 0
-                while True:
-                    if assets[key].arr[idx+1][5] == Rate:
-                        idx += 1
-                        count += 1
-                    else:
-                        write_orderData()
-                        assets[key].arr.insert(idx+1, OrderData)
-                        for i, price in enumerate(assets[key].prices):
-                            if price == Rate:
-                                write_orderData()
-                                assets[key].queue[i].insert(count+1, OrderData)
-                                break
-                        break
-                in_the_end()
-                return
-
-        if type == 'Buy':
-            write_orderData()
-            assets[key].arr.append(OrderData)
-            assets[key].prices.insert(0, Rate)
-            assets[key].queue.insert(0, [OrderData])
-        else:
-            write_orderData()
-            assets[key].arr.append(OrderData)
-            assets[key].prices.append(Rate)
-            assets[key].queue.append([OrderData])
-        in_the_end()
+def run_simulation():
+    while not event_firstEmit.is_set(): # wait for the first client
+        socketio.sleep(0.1)
+    if pool:
+        pool.broadcast(('start',))
+    else:
+        scheduler.run()
+
+
+# worker processes when the assets are sharded (see shard.py)
+pool = None
+# users' orders held by the workers: username -> {shard: orders}
+remoteOrders = {}
+
+
+# events of the sharded assets, passed on like those of the assets simulated in this process
+def handle_shard_event(msg):
+    kind = msg[0]
+    if kind == 'record':
+        journal.put(msg[1])
+    elif kind == 'records':
+        journal.put_many(msg[1])
+    elif kind == 'ticker':
+        emit_ticker(registry[msg[1]], msg[2])
+    elif kind == 'order_book':
+        obj = registry[msg[1]]
+        obj.sellOB, obj.buyOB = msg[2], msg[3]
+        emit_order_book(obj)
+    elif kind == 'placed_orders':
+        remoteOrders.setdefault(msg[2], {})[msg[1]] = msg[3]
+        emit_placed_orders(msg[2])
+    elif kind == 'deduct':
+        hooks.deduct(msg[1], msg[2])
+    elif kind == 'refund':
+        hooks.refund(*msg[1:])
+    elif kind == 'emit':
+        socketio.emit(msg[1], msg[2])
+
+
+# trades are persisted in batches by a single writer thread
+journal = TradeJournal(app, db, PriceRow, app.config["JOURNAL_BATCH_SIZE"], app.config["JOURNAL_FLUSH_MS"], run_blocking)
+journal.subscribe(emit_floorsheet)
+
+# net obligations between the brokers, updated with every committed batch of trades
+settlement = Settlement()
+journal.subscribe(settlement.update)
+
+# OHLCV bars of every symbol, the bars changed by a batch go to the symbol's room
+candles = Candles()
+
+def emit_candles(rows):
+    for sym, interval, bar in candles.update(rows):
+        # keyed by the bar's start too, so that the final state of a bar closing within the frame isn't dropped
+        outbox.post(('candle', sym, interval, bar[0]), lambda sym=sym, interval=interval, bar=bar: [('candle', {'sym': sym, 'interval': interval, 'bar': bar}, symbol_room(sym))])
+
+journal.subscribe(emit_candles)
+
+# matching engine's output goes to the journal & the clients
+hooks.record = journal.put
+hooks.records = journal.put_many
+hooks.ticker = emit_ticker
+hooks.order_book = emit_order_book
+hooks.placed_orders = emit_placed_orders
+hooks.deduct = deduct
+hooks.refund = refund
+hooks.emit = socketio.emit
 
 
 # Login page
@@ -459,10 +294,92 @@ def logout():
     flash('Logged out successfully.', 'info')
     return redirect(url_for('login'))
 
-# Net Settlement admin's route
+# Floorsheet rows after the `after` id, filtered on symbol, buyerID, sellerID, min/maxRate & min/maxQty
+@app.route('/api/floorsheet')
+def api_floorsheet():
+    try:
+        after, limit = page_args(request.args)
+        rows, more = page(PriceRow, request.args, after, limit)
+    except ValueError as e:
+        return str(e), 400
+    return jsonify({'rows': rows, 'next': rows[-1]['id'] if more else None})
+
+# Whole filtered floorsheet as a csv file, streamed page by page
+@app.route('/api/floorsheet.csv')
+def api_floorsheet_csv():
+    args = request.args.to_dict()
+    try:
+        filtered(PriceRow, args) # reject bad filters before streaming
+    except ValueError as e:
+        return str(e), 400
+    return Response(stream_with_context(export_csv(PriceRow, args)), mimetype='text/csv', headers={'Content-Disposition': 'attachment; filename=floorsheet.csv'})
+
+
+# Latest OHLCV bars of a symbol: ?symbol=, ?interval=1s|1m|5m, ?limit=N (bars are [start time (epoch sec), open, high, low, close, volume])
+@app.route('/api/candles')
+def api_candles():
+    sym = request.args.get('symbol', symbol)
+    interval = request.args.get('interval', '1m')
+    if interval not in INTERVALS:
+        return "Unknown interval: " + interval, 400
+    try:
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+    except ValueError as e:
+        return str(e), 400
+    asset = registry.get(sym)
+    if asset is not None and asset.prevClose is None:
+        asset.load_PrevClose() # not loaded in this process (yet, or at all when simulated by a shard)
+    return jsonify({'sym': sym, 'interval': interval, 'prevClose': asset.prevClose if asset else None, 'bars': candles.history(sym, interval, limit)})
+
+
+# response refusing a client that isn't logged in as the admin (None for the admin)
+def admin_denied():
+    user = users.get(session.get('username'))
+    if user is None:
+        return redirect(url_for('login'))
+    if not user.is_admin:
+        return "Admins only", 403
+    return None
+
+# Net Settlement admin's route: net position of each broker & netted obligations between them (optionally of one broker / symbol)
 @app.route('/settlement')
 def manage_all_users():
-    pass
+    denied = admin_denied()
+    if denied:
+        return denied
+    broker = request.args.get('broker')
+    return jsonify({
+        'brokers': settlement.positions(broker),
+        'obligations': settlement.obligations(broker, request.args.get('symbol'))
+    })
+
+# Netted obligation graph (edges of the largest qty first) for graph_d3.html: ?mode=bilateral|multilateral, ?symbol=, ?top=N
+@app.route('/graph_data')
+def graph_data():
+    denied = admin_denied()
+    if denied:
+        return denied
+    mode = request.args.get('mode', 'bilateral')
+    if mode not in ('bilateral', 'multilateral'):
+        return "Unknown mode: " + mode, 400
+    try:
+        top = int(request.args['top']) if request.args.get('top') else None
+    except ValueError as e:
+        return str(e), 400
+    body, version = settlement.graph(mode, request.args.get('symbol') or None, top)
+    etag = f'{version}-{mode}-{request.args.get("symbol", "")}-{top}'
+    if etag in request.if_none_match:
+        return Response(status=304)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+@app.route('/graph')
+def graph():
+    denied = admin_denied()
+    if denied:
+        return denied
+    return render_template("graph_d3.html")
 
 # Home page
 @app.route("/")
@@ -475,30 +392,89 @@ def index():
 @app.route('/place_order', methods=['POST'])
 def place_order():
     try:
-        global Orders
-        
         Rate = float(request.form.get('rate'))
         Qty = int(request.form.get('qty'))
         action = request.form.get('action')  # Get whether it's a buy or sell order
-        Orders += 1
-
-        if Rate == 0: # market execution
-            placedOrders.append([Orders, symbol, Qty, 'MKT', Qty, action, False, session['username'], users.get(session['username']).name])
-            MKT_Orders.append(Orders)
-        else: # limit order
-            placedOrders.append([Orders, symbol, Qty, Rate, Qty, action, False, session['username'], users.get(session['username']).name])
-            for idx, asset in enumerate(assets):
-                if asset.arr[0][9] == placedOrders[Orders-1][1]:
-                    asset.subThreads += 1
-                    threading.Thread(target=LMT_place, args=(Rate, Qty, Orders, action, idx)).start() # run process in background
-                    break
-        socketio.emit('placed_orders', {'placedOrders': placedOrders})
+        sym = request.form.get('symbol') or symbol # the asset the client is displaying
+        if sym not in registry:
+            return "Unknown symbol: " + sym, 400
+
+        order = (sym, Qty, Rate, action, session['username'], users.get(session['username']).name) # Rate 0 is a market execution
+        if pool:
+            pool.send(pool.shard_of(registry[sym].id), ('place',) + order)
+        else:
+            place(*order)
 
         return "Order successfully placed", 200
     except Exception as e:
         print(f"Error: {str(e)}")  # Debugging line for error
         return str(e), 400
 
+# Cancel the rest of an open order
+@app.route('/cancel_order', methods=['POST'])
+def cancel_order():
+    try:
+        OrderNo = int(request.form.get('order_id'))
+        order = user_order(session['username'], OrderNo)
+        if order is None:
+            return "No such order", 404
+        if order[4] == 0 or order[9]:
+            return "Order is already closed", 400
+
+        with lock_cancel:
+            if OrderNo in cancelling:
+                return "Order is already being cancelled", 400
+            cancelling.add(OrderNo)
+        if pool:
+            pool.send(pool.shard_of(registry[order[1]].id), ('cancel', OrderNo))
+        else:
+            cancel(OrderNo)
+
+        return "Order cancellation requested", 200
+    except Exception as e:
+        return str(e), 400
+
+# Change the qty & rate of an open LMT order
+@app.route('/amend_order', methods=['POST'])
+def amend_order():
+    try:
+        OrderNo = int(request.form.get('order_id'))
+        Rate = float(request.form.get('rate'))
+        Qty = int(request.form.get('qty'))
+        order = user_order(session['username'], OrderNo)
+        if order is None:
+            return "No such order", 404
+        if order[4] == 0 or order[9]:
+            return "Order is already closed", 400
+        if order[3] == 'MKT' or Rate <= 0 or Qty <= 0:
+            return "Only LMT orders can be amended, to a positive qty & rate", 400
+        # same limits as a new order (see the order form in script.js): it mustn't cross the book the clients are shown
+        if Qty < 10:
+            return "Quantity must be of at least 10 units", 400
+        sellOB, buyOB = registry[order[1]].publishedOB[1]
+        if order[5] == 'Buy' and sellOB and Rate > sellOB[0][2]:
+            return "Buy limit exceeds the best ask", 400
+        if order[5] == 'Sell' and buyOB and Rate < buyOB[0][2]:
+            return "Sell limit falls short of the best bid", 400
+        # the difference to what the order already holds is taken on amendment
+        user = users.get(session['username'])
+        if order[5] == 'Buy' and Qty * Rate - order[4] * order[3] > user.collateral:
+            return "Amount exceeds your collateral", 400
+        if order[5] == 'Sell' and Qty - order[4] > user.balance.get(order[1], 0):
+            return "Qty exceeds your balance", 400
+
+        with lock_cancel:
+            if OrderNo in cancelling:
+                return "Order is being cancelled", 400
+            if pool:
+                pool.send(pool.shard_of(registry[order[1]].id), ('amend', OrderNo, Qty, Rate))
+            else:
+                amend(OrderNo, Qty, Rate)
+
+        return "Order amendment requested", 200
+    except Exception as e:
+        return str(e), 400
+
 
 # Deduct collateral on purchase
 @socketio.on('deduct_buy')
@@ -516,9 +492,10 @@ def handle_deduction(data):
 @socketio.on('deduct_sell')
 def handle_deduction(data):
     deduction = data.get('qty')
+    sym = data.get('sym') or session.get('symbol', symbol)
 
     user = users.get(session['username'])
-    user.balance[symbol] -= deduction
+    user.balance[sym] -= deduction
 
     # Emit updated balance to the same client
     if 'username' in session:
@@ -535,26 +512,84 @@ def handle_conncet():
             'collateral': users.get(session['username']).collateral
             }, room=request.sid)
         
-        socketio.emit('placed_orders', {'placedOrders': placedOrders})
+        join_room(user_room(session['username']))
+        socketio.emit('placed_orders', {'placedOrders': user_orders(session['username'])}, room=request.sid)
 
+    join_room(symbol_room(symbol)) # default asset until the client selects one
     event_firstEmit.set()
 
+# Catch-up page of floorsheet rows after the client's last known row id
+@socketio.on('floorsheet_sync')
+def handle_floorsheet_sync(data):
+    try:
+        after, _ = page_args(data)
+    except (ValueError, TypeError):
+        return # not a row id
+    seq = floorsheetSeq # read before querying so that no delta is skipped by the client
+
+    tranDataDict, more = page(PriceRow, {}, after, FLOORSHEET_PAGE_SIZE)
+    socketio.emit('floorsheet_page', {'rows': tranDataDict, 'seq': seq, 'more': more}, room=request.sid)
+
 @socketio.on('scrip_selected')
 def handle_scrip_selected(data):
-    global symbol
-
     scrip = data.get('scrip')
-    
-    symbol = scrip
+
+    # kept per connection (the default symbol stays the same for everyone)
+    session['symbol'] = scrip
+
+    # receive the order book of the selected asset only
+    for room in rooms():
+        if room.startswith('sym:'):
+            leave_room(room)
+    join_room(symbol_room(scrip))
+
+    # build the asset's order book if it's the first time it's being viewed
+    asset = registry.get(scrip)
+    if asset is not None:
+        if pool:
+            pool.send(pool.shard_of(asset.id), ('load', scrip))
+        else:
+            asset.load()
+        socketio.emit('order_book', book_snapshot(asset), room=request.sid) # deltas apply on top of this
+
+# Full order book after the client missed a delta
+@socketio.on('book_snapshot')
+def handle_book_snapshot(data):
+    asset = registry.get(data.get('sym'))
+    if asset is not None:
+        socketio.emit('order_book', book_snapshot(asset), room=request.sid)
 
 
 # Runner & debugger
 if __name__ == "__main__":
     with app.app_context():
         db.create_all()
+        add_columns(PriceRow, db.engine)
+        create_indexes(PriceRow, db.engine)
+    settlement.seed(app, db, PriceRow) # before the journal adds new trades
+    candles.seed(app, db, PriceRow)
+    journal.start()
+
+    if app.config["SHARDS"] > 0:
+        print("Starting shards ...")
+        pool = ShardPool(app.config["SHARDS"])
+        pool.start()
+        for k in range(pool.count):
+            socketio.start_background_task(pool.listen, k, handle_shard_event)
+    else:
+        if PREWARM_ASSETS:
+            socketio.start_background_task(prewarm)
 
-    print("Creating threads ...")
-    for obj in assets:
-        threading.Thread(target=orderMatch_sim, args=(obj,)).start()
+        print("Creating tasks ...")
+        for obj in assets:
+            scheduler.spawn(orderMatch_sim(obj))
+    socketio.start_background_task(run_simulation)
+    socketio.start_background_task(outbox.run)
+    socketio.start_background_task(write_summary) # not needed by the simulation, kept off the start-up path
 
-    socketio.run(app, debug=True, use_reloader=False)
+    try:
+        socketio.run(app, debug=True, use_reloader=False)
+    finally:
+        if pool:
+            pool.close()
+        journal.close() # flush pending trades on shutdown
@@ -0,0 +1,118 @@
+# Headless replay of trading days through the matching engine, without the web server
+#   python backtest.py ./data/2024-08-01 [more days ...] [--orders orders.csv] [--out fills] [--format csv|parquet] [--jobs N]
+import argparse
+import csv
+import os
+import subprocess
+import sys
+import time
+
+
+# columns of the scripted orders file (rate 0 is a market execution):
+#   at = simulated seconds since the start of the replay, symbol, action = Buy/Sell, qty, rate
+ORDER_COLUMNS = ['at', 'symbol', 'action', 'qty', 'rate']
+FILL_COLUMNS = ['conID', 'buyerID', 'sellerID', 'qty', 'rate', 'buyerName', 'sellerName', 'symbol', 'time']
+USERNAME = 'backtest'
+
+
+# previous trading day's file (by name) in the same directory, for the closing prices
+def prev_day(path):
+    directory, name = os.path.split(path)
+    days = sorted(x for x in os.listdir(directory or '.') if x[:4].isdigit() and x < name and os.path.isfile(os.path.join(directory, x)))
+    return os.path.join(directory, days[-1]) if days else None
+
+
+def read_orders(path):
+    orders = []
+    with open(path, 'r') as csv_file:
+        for line in csv.DictReader(csv_file):
+            orders.append((float(line['at']), line['symbol'], line['action'], int(line['qty']), float(line['rate'])))
+    orders.sort(key=lambda x: x[0])
+    return orders
+
+
+def write_fills(fills, path, format):
+    if format == 'parquet':
+        import pyarrow as pa # optional dependency, only needed for parquet output
+        import pyarrow.parquet as pq
+        pq.write_table(pa.Table.from_pylist(fills), path)
+        return
+    with open(path, 'w', newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=FILL_COLUMNS)
+        writer.writeheader()
+        writer.writerows(fills)
+
+
+# replay the day given by DAY_FILE/PREV_DAY_FILE as fast as possible (run in its own process)
+def run_day(orders_file, out, format):
+    import engine # loads the day's data
+    from scheduler import Scheduler
+
+    fills = []
+    engine.hooks.record = fills.append
+    scheduler = Scheduler(0)
+
+    def script(orders):
+        for at, sym, action, qty, rate in orders:
+            if sym not in engine.registry:
+                print(sym, "is not simulated, order skipped.")
+                continue
+            if at > scheduler.now:
+                yield at - scheduler.now
+            engine.place(sym, qty, rate, action, USERNAME, USERNAME)
+
+    for obj in engine.assets:
+        scheduler.spawn(engine.orderMatch_sim(obj))
+    if orders_file:
+        scheduler.spawn(script(read_orders(orders_file)))
+
+    ticks = 0
+    start = time.perf_counter()
+    while scheduler.step():
+        ticks += 1
+    elapsed = time.perf_counter() - start
+
+    write_fills(fills, out, format)
+    filled = sum(1 for order in engine.placedOrders.values() if order[4] == 0)
+    print(f"{os.environ['DAY_FILE']}: {len(fills)} trades, {ticks} ticks ({scheduler.now:.0f} simulated s) in {elapsed:.2f} s "
+          f"({len(fills) / elapsed:.0f} trades/s, {ticks / elapsed:.0f} ticks/s), {filled}/{len(engine.placedOrders)} orders filled -> {out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay trading days through the order matching simulation.")
+    parser.add_argument('days', nargs='+', help="day files to replay")
+    parser.add_argument('--orders', help="csv of scripted orders (" + ', '.join(ORDER_COLUMNS) + ")")
+    parser.add_argument('--out', default='.', help="directory to write the fills of each day to")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--jobs', type=int, default=1, help="no. of days replayed in parallel")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_day(args.orders, os.path.join(args.out, os.path.basename(args.days[0]) + '.' + args.format), args.format)
+        return
+
+    # every day runs in a fresh process, as the engine loads its day on import
+    os.makedirs(args.out, exist_ok=True)
+    running = []
+    failed = 0
+    for day in args.days:
+        env = dict(os.environ, DAY_FILE=day)
+        prev = prev_day(day)
+        if prev:
+            env['PREV_DAY_FILE'] = prev
+        cmd = [sys.executable, os.path.abspath(__file__), day, '--worker', '--out', args.out, '--format', args.format]
+        if args.orders:
+            cmd += ['--orders', args.orders]
+        running.append(subprocess.Popen(cmd, env=env))
+        if len(running) >= args.jobs:
+            failed += running.pop(0).wait() != 0
+    for proc in running:
+        failed += proc.wait() != 0
+    if failed:
+        print(failed, "day(s) failed!")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+from utils import AssetData, allSymbols
+from seperate_assets import DAY_FILE, refine, trades
+from trade_cache import load_day, symbol_ranges, rows, parse, build_cache
+from normalizer import TransactionGraph, net_positions, minimal_transfers
+
+import csv
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+
+# run fn(*args), returns (result, seconds taken, peak bytes allocated)
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+# bytes still allocated by the result of fn(*args)
+def retained(fn, *args):
+    tracemalloc.start()
+    result = fn(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+# trades as they used to be represented: one 10-element list per row, straight from csv.reader
+def as_lists(trades):
+    return [[x.id, x.conID, x.buyerID, x.sellerID, x.qty, x.rate, x.time, x.buyerName, x.sellerName, x.symbol] for x in trades]
+
+
+def legacy_rows(sym):
+    current = []
+    with open(DAY_FILE, 'r') as csv_file:
+        csv_reader = csv.reader(csv_file)
+        next(csv_reader)
+        for line in csv_reader:
+            if line[3] != sym:
+                continue
+            try:
+                dateTime = datetime.strptime(line[14], "%Y-%m-%dT%H:%M:%S.%f")
+            except ValueError:
+                dateTime = datetime.strptime(line[14], "%Y-%m-%dT%H:%M:%S")
+            current.append([line[0], line[1], line[4], line[5], int(line[6]), float(line[7]), dateTime, line[12], line[13], line[3]])
+    return current
+
+
+# queue construction as it used to be: radix sorted unique prices, then a full scan of arr per price copying matching rows
+def legacy_createQueue(arr):
+    def counting_sort(arr, exp):
+        n = len(arr)
+        output = [0] * n
+        count = [0] * 10
+        for i in range(n):
+            index = (arr[i] // exp) % 10
+            count[index] += 1
+        for i in range(1, 10):
+            count[i] += count[i - 1]
+        for i in range(n - 1, -1, -1):
+            index = (arr[i] // exp) % 10
+            output[count[index] - 1] = arr[i]
+            count[index] -= 1
+        for i in range(n):
+            arr[i] = output[i]
+
+    def radixSort(arr):
+        scale_factor = 10 ** max(len(str(price).split('.')[1]) if '.' in str(price) else 0 for price in arr)
+        int_arr = [int(price * scale_factor) for price in arr]
+        max_val = max(int_arr)
+        exp = 1
+        while max_val // exp > 0:
+            counting_sort(int_arr, exp)
+            exp *= 10
+        return [price / scale_factor for price in int_arr]
+
+    prices = AssetData.remove_duplicates(radixSort([el[5] for el in arr]))
+    queue = []
+    for price in prices:
+        temp = []
+        for x in arr:
+            if(price == x[5]):
+                temp.append([x[0], x[1], x[2], x[3], x[4], x[5], x[6], x[7], x[8], x[9]])
+        queue.append(temp)
+    return queue
+
+
+# rows of the most liquid symbol in the data file
+def most_traded():
+    return max(allSymbols, key=lambda rows: rows[1] - rows[0])
+
+
+def bench_createQueue():
+    sec = trades(*most_traded())
+    print(f"createQueue on {sec[0].symbol} ({len(sec)} trades)")
+
+    _, elapsed, peak = measure(legacy_createQueue, as_lists(sec[::-1]))
+    print(f"  previous:  {elapsed * 1000:9.2f} ms  {peak / 1024:9.1f} KiB")
+
+    asset = AssetData(most_traded(), 0)
+    asset.arr = sec[::-1]
+    _, elapsed, peak = measure(asset.createQueue)
+    print(f"  current:   {elapsed * 1000:9.2f} ms  {peak / 1024:9.1f} KiB")
+
+
+def bench_records():
+    start, stop = most_traded()
+    sec = trades(start, stop)
+    print(f"trade records of {sec[0].symbol} ({len(sec)} trades)")
+
+    # previously every row was held twice: in arr and as a copy in the queue
+    lists, size = retained(legacy_rows, sec[0].symbol)
+    _, copies = retained(lambda arr: [list(x) for x in arr], lists)
+    print(f"  previous:  {(size + copies) / len(sec):7.1f} bytes/trade")
+
+    columns, vocab = load_day(DAY_FILE)
+    _, size = retained(rows, columns, vocab, start, stop)
+    print(f"  current:   {size / len(sec):7.1f} bytes/trade")
+
+
+def bench_ingestion():
+    print(f"ingestion of {DAY_FILE}")
+
+    # previously the whole file was parsed in memory and every symbol materialized before the selection
+    def previous():
+        columns, vocab = parse(DAY_FILE)
+        return [rows(columns, vocab, start, stop) for start, stop in symbol_ranges(columns)]
+    _, elapsed, peak = measure(previous)
+    print(f"  previous:  {elapsed * 1000:9.2f} ms  {peak / 1024:9.1f} KiB")
+
+    def current(path):
+        build_cache(path)
+        columns, vocab = load_day(path)
+        return [rows(columns, vocab, start, stop) for start, stop in refine(symbol_ranges(columns))]
+    with tempfile.TemporaryDirectory() as directory:
+        path = shutil.copy(DAY_FILE, os.path.join(directory, os.path.basename(DAY_FILE)))
+        _, elapsed, peak = measure(current, path)
+    print(f"  current:   {elapsed * 1000:9.2f} ms  {peak / 1024:9.1f} KiB")
+
+
+def bench_netting():
+    columns, vocab = load_day(DAY_FILE)
+    buyers = np.array(vocab['buyer'])[columns['buyer']]
+    sellers = np.array(vocab['seller'])[columns['seller']]
+    qtys = columns['qty']
+    print(f"netting of {DAY_FILE} ({len(qtys)} trades, {len(set(vocab['buyer']) | set(vocab['seller']))} brokers)")
+
+    # previously: one networkx edge per broker pair, then only the reciprocal pairs cancelled
+    def previous():
+        graph = TransactionGraph()
+        for buyer, seller, qty in zip(buyers.tolist(), sellers.tolist(), qtys.tolist()):
+            graph.add_transaction(buyer, seller, qty)
+        graph.normalize()
+        return graph.get_normalized_graph()
+    edges, elapsed, peak = measure(previous)
+    print(f"  bilateral:    {elapsed * 1000:9.2f} ms  {peak / 1024:9.1f} KiB  {len(edges)} transfers")
+
+    def current():
+        return minimal_transfers(*net_positions(buyers, sellers, qtys))
+    edges, elapsed, peak = measure(current)
+    print(f"  multilateral: {elapsed * 1000:9.2f} ms  {peak / 1024:9.1f} KiB  {len(edges)} transfers")
+
+
+if __name__ == "__main__":
+    bench_createQueue()
+    bench_records()
+    bench_ingestion()
+    bench_netting()
@@ -0,0 +1,82 @@
+import threading
+from collections import deque
+
+from sqlalchemy import Integer, cast, func
+from sqlalchemy.orm import aliased
+
+
+# bar intervals (sec) kept for every symbol
+INTERVALS = {'1s': 1, '1m': 60, '5m': 300}
+# max. bars kept per symbol & interval, the oldest are dropped
+CANDLES_KEPT = 500
+
+
+# OHLCV bars of every symbol on the simulated clock, updated with each persisted trade
+class Candles():
+    def __init__(self, keep=CANDLES_KEPT) -> None:
+        self.keep = keep
+        # symbol -> interval -> deque of bars [start time (simulated, epoch sec), open, high, low, close, volume], oldest first
+        self.bars = {}
+        self.lock = threading.Lock()
+
+
+    # add a trade at time t to the bars of its symbol, returns the bars it changed as (interval, bar)
+    def add(self, sym, rate, qty, t):
+        series = self.bars.get(sym)
+        if series is None:
+            series = self.bars[sym] = {name: deque(maxlen=self.keep) for name in INTERVALS}
+        changed = []
+        for name, seconds in INTERVALS.items():
+            bars = series[name]
+            start = int(t // seconds * seconds)
+            if bars and bars[-1][0] >= start: # a late trade goes to the current bar
+                bar = bars[-1]
+                bar[2] = max(bar[2], rate)
+                bar[3] = min(bar[3], rate)
+                bar[4] = rate
+                bar[5] += qty
+            else:
+                bar = [start, rate, rate, rate, rate, qty]
+                bars.append(bar)
+            changed.append((name, bar))
+        return changed
+
+
+    # journal listener: committed rows of a batch, bucketed on their (simulated) trade time,
+    # returns the latest state of every bar they changed as (symbol, interval, bar)
+    def update(self, rows):
+        changed = {}
+        with self.lock:
+            for row in rows:
+                if row['time'] is None:
+                    continue
+                for name, bar in self.add(row['symbol'], row['rate'], row['qty'], row['time']):
+                    changed[(row['symbol'], name)] = bar
+            return [(sym, name, list(bar)) for (sym, name), bar in changed.items()]
+
+
+    # bars of the trades already in the database (call before the journal starts):
+    # the database aggregates them into 1s bars, whose open/close are the rates of their first/last trade
+    def seed(self, app, db, model):
+        second = cast(model.time, Integer)
+        with app.app_context():
+            grouped = db.session.query(model.symbol.label('symbol'), second.label('start'), func.min(model.id).label('first'), func.max(model.id).label('last'),
+                                       func.max(model.rate).label('high'), func.min(model.rate).label('low'), func.sum(model.qty).label('qty')) \
+                .filter(model.time.isnot(None)).group_by(model.symbol, second).subquery()
+            first, last = aliased(model), aliased(model)
+            bars = db.session.query(grouped.c.symbol, grouped.c.start, first.rate, grouped.c.high, grouped.c.low, last.rate, grouped.c.qty) \
+                .join(first, first.id == grouped.c.first).join(last, last.id == grouped.c.last) \
+                .order_by(grouped.c.symbol, grouped.c.start).all()
+        with self.lock:
+            for sym, start, open, high, low, close, qty in bars:
+                # volume goes with the open, the other prices only extend the bars
+                for rate, volume in ((open, qty), (high, 0), (low, 0), (close, 0)):
+                    self.add(sym, rate, volume, start)
+
+
+    # last `limit` bars of a symbol (oldest first)
+    def history(self, sym, interval, limit=None):
+        with self.lock:
+            bars = self.bars.get(sym, {}).get(interval, ())
+            bars = [list(bar) for bar in bars]
+        return bars[-limit:] if limit else bars
@@ -0,0 +1,343 @@
+from utils import *
+from gen_prices import genPrices
+from trade import Trade
+
+import random
+
+
+# what the matching engine reports to the outside world, set by the front-end (app.py, backtest.py)
+class Hooks():
+    def __init__(self) -> None:
+        # trade (dict of PriceRow columns) to be persisted
+        self.record = lambda row: None
+        # several trades to be persisted together
+        self.records = lambda rows: [self.record(row) for row in rows]
+        # LTP of an asset changed
+        self.ticker = lambda obj, ltp: None
+        # order book of an asset was regenerated
+        self.order_book = lambda obj: None
+        # a user's placed orders changed
+        self.placed_orders = lambda username: None
+        # collateral to deduct from a user on a filled buy order
+        self.deduct = lambda username, amt: None
+        # shares (qty of sym) & collateral (amt) given back to a user when an order is cancelled or amended (negative: taken)
+        self.refund = lambda username, sym, qty, amt: None
+        # any other event for all clients
+        self.emit = lambda event, data: None
+
+
+hooks = Hooks()
+
+
+# next OrderID (also used up for the contractIDs of partial fills)
+def new_OrderNo():
+    global Orders
+    with lock_orders:
+        Orders += SHARD_COUNT
+        return Orders
+
+
+# register a user's order and hand it to its asset, returns its OrderNo
+def place(sym, Qty, Rate, action, username, name):
+    OrderNo = new_OrderNo()
+    with lock_orders:
+        if Rate == 0: # market execution
+            placedOrders[OrderNo] = [OrderNo, sym, Qty, 'MKT', Qty, action, False, username, name, False]
+            command = ('market', OrderNo)
+        else: # limit order
+            placedOrders[OrderNo] = [OrderNo, sym, Qty, Rate, Qty, action, False, username, name, False]
+            command = ('place', OrderNo)
+    if sym in registry:
+        registry[sym].inbox.append(command) # applied by the asset's task on its next tick
+    hooks.placed_orders(username)
+    return OrderNo
+
+
+# copies of a user's orders (safe to call from any thread)
+def orders_of(username):
+    with lock_orders:
+        return [list(order) for order in placedOrders.values() if order[7] == username]
+
+
+# cancel the rest of a user's order (applied by its asset's task, if the order is still open by then)
+def cancel(OrderNo):
+    registry[placedOrders[OrderNo][1]].inbox.append(('cancel', OrderNo))
+
+
+# change the qty & rate of a user's LMT order (it loses its time priority)
+def amend(OrderNo, Qty, Rate):
+    registry[placedOrders[OrderNo][1]].inbox.append(('amend', OrderNo, Qty, Rate))
+
+
+# (shares, collateral) held by the open rest of an order since it was placed, MKT buys are only charged when filled
+def held(order):
+    if order[5] == 'Sell':
+        return order[4], 0
+    return 0, order[4] * order[3] if order[3] != 'MKT' else 0
+
+
+def genConID(OrderNo):
+    return datecode + '1' + '0' * (7 - len(str(OrderNo))) + str(OrderNo)
+
+
+# apply the commands received since the last tick, in the order they arrived (only called from the asset's task)
+def drain_inbox(obj):
+    for _ in range(len(obj.inbox)): # only those already queued, orders arriving meanwhile wait for the next tick
+        kind, OrderNo, *args = obj.inbox.popleft()
+        order = placedOrders[OrderNo]
+        if kind == 'place':
+            LMT_place(order[3], order[2], OrderNo, order[5], obj)
+        elif kind == 'market':
+            obj.mktOrders.append(OrderNo)
+        elif order[4] == 0 or order[9]:
+            continue # already filled or cancelled
+        elif kind == 'cancel':
+            if order[3] == 'MKT':
+                obj.mktOrders.remove(OrderNo)
+            else:
+                LMT_remove(OrderNo, obj)
+            qty, amt = held(order)
+            order[9] = True
+            hooks.refund(order[7], order[1], qty, amt)
+            hooks.placed_orders(order[7])
+        elif kind == 'amend' and order[3] != 'MKT':
+            LMT_remove(OrderNo, obj)
+            qty, amt = held(order)
+            order[2], order[3], order[4] = args[0], args[1], args[0]
+            newQty, newAmt = held(order)
+            hooks.refund(order[7], order[1], qty - newQty, amt - newAmt)
+            LMT_place(order[3], order[2], OrderNo, order[5], obj)
+
+
+# take a user's LMT order out of the book by its OrderNo
+def LMT_remove(OrderNo, obj):
+    conID = genConID(OrderNo)
+    if obj.book.cancel(conID) is not None:
+        del obj.orderNos[conID]
+
+
+# fill the user's LMT orders reached by the price being replayed: bids at or above it & asks at or below it, best price first
+def LMT_fill(obj):
+    price = obj.arr[0].rate
+    filled = []
+    while obj.book.best_bid is not None and obj.book.best_bid >= price:
+        filled.append(obj.book.pop_best('Buy'))
+    while obj.book.best_ask is not None and obj.book.best_ask <= price:
+        filled.append(obj.book.pop_best('Sell'))
+    if not filled:
+        return
+
+    rows = []
+    usernames = set()
+    for OrderData in filled:
+        OrderData.time = obj.arr[0].time # traded now
+        rows.append(OrderData.to_dict())
+        OrderNo = obj.orderNos.pop(OrderData.conID)
+        placedOrders[OrderNo][4] = 0
+        usernames.add(placedOrders[OrderNo][7])
+    hooks.records(rows)
+    for username in usernames:
+        hooks.placed_orders(username)
+
+# fill the oldest MKT order of the asset against as many levels of the generated order book as it takes, in one pass
+def MKT_execute(obj):
+    i = obj.mktOrders[0] # grab order id of this order
+    order = placedOrders[i]
+    levels = obj.sellOB if order[5] == 'Buy' else obj.buyOB # best ask/bid first
+
+    # Order ready to be filled
+    order[6] = True
+
+    rows = []
+    amt = 0
+    t = obj.arr[0].time.timestamp() # simulated time: that of the trade being replayed
+    while order[4] > 0 and levels:
+        level = levels[0]
+        qty = min(order[4], level[1])
+
+        # first fill carries the order's own contractID, the rest get new ones
+        if order[2] == order[4]:
+            conID = genConID(i)
+        else:
+            conID = genConID(new_OrderNo())
+        rand = random.choice(obj.arr)
+        if order[5] == 'Buy':
+            rows.append(dict(conID=conID, buyerID=100, sellerID=rand.sellerID, qty=qty, rate=level[2], buyerName=order[8], sellerName=rand.sellerName, symbol=obj.symbol, time=t))
+        else:
+            rows.append(dict(conID=conID, buyerID=rand.buyerID, sellerID=100, qty=qty, rate=level[2], buyerName=rand.buyerName, sellerName=order[8], symbol=obj.symbol, time=t))
+        amt += qty * level[2]
+        order[4] -= qty
+
+        if qty == level[1]: # whole level taken
+            del levels[0]
+        else: # update the top bid/ask
+            level[0] = int(level[0] * (1 - (qty / level[1]))) if level[0] > 1 else level[0]
+            level[1] -= qty
+
+    # all fills are persisted & published together
+    if rows:
+        hooks.records(rows)
+        hooks.ticker(obj, rows[-1]['rate'])
+        hooks.order_book(obj)
+        if order[5] == 'Buy':
+            hooks.deduct(order[7], amt)
+    hooks.placed_orders(order[7])
+
+    if order[4] == 0: # when all qty is filled
+        obj.mktOrders.popleft()
+
+
+# simulation task of a single asset, driven by the scheduler (yields the time it wants to wait)
+def orderMatch_sim(obj):
+
+    def genOB(rate):
+        # top bid & ask prices in order book
+        bidPrices = []; askPrices = []
+        bidPrices = genPrices(rate, 'bids', obj.book.prices)
+        askPrices = genPrices(rate, 'asks', obj.book.prices)
+        sellFillers, buyFillers = obj.fillers
+
+        # generating asks order book
+        for i in range(0, TOP_BIDSASKS_NO): # filling each row in order book
+            obj.sellOB.append([0, 0, askPrices[i]]) # initializing row data: [orders, qty, price]
+            brokers = [] # collects all the brokers in the list for that particular price
+            if(i == 0):
+                # only the orders about to be matched next are on offer at the top ask
+                idx = 0
+                while(idx < len(obj.arr) and obj.arr[idx].rate == obj.sellOB[i][2]):
+                    idx += 1
+                orders = obj.book.head_n(obj.sellOB[i][2], idx)
+            else:
+                orders = obj.book.level(obj.sellOB[i][2]) # orders data realted to current price in queue
+            for y in orders:
+                obj.sellOB[i][1] += y.qty # fetching qty and adding
+                brokers.append(y.sellerID) # append all brokers
+            if(len(brokers) == 0):
+                if obj.sellOB[i][2] not in sellFillers:
+                    # random qty between 10-1300, mostly being of 100-300 & random orders between 1-20, mostly being around 7
+                    sellFillers[obj.sellOB[i][2]] = [int(random.triangular(1, 20, 7)), int(random.triangular(10, 1300, 200))]
+                obj.sellOB[i][0], obj.sellOB[i][1] = sellFillers[obj.sellOB[i][2]]
+            else:
+                obj.sellOB[i][0] = len(obj.remove_duplicates(brokers)) # total orders
+        
+        # generating bids order book
+        for i in range(0, TOP_BIDSASKS_NO):
+            obj.buyOB.append([0, 0, bidPrices[i]])
+            brokers = []
+            for y in obj.book.level(obj.buyOB[i][2]):
+                obj.buyOB[i][1] += y.qty
+                brokers.append(y.buyerID)
+            if(len(brokers) == 0):
+                if obj.buyOB[i][2] not in buyFillers:
+                    buyFillers[obj.buyOB[i][2]] = [int(random.triangular(1, 20, 7)), int(random.triangular(10, 1300, 200))]
+                obj.buyOB[i][0], obj.buyOB[i][1] = buyFillers[obj.buyOB[i][2]]
+            else:
+                obj.buyOB[i][0] = len(obj.remove_duplicates(brokers))
+
+        # forget the fillers of prices that scrolled out of the order book
+        obj.fillers = ({price: sellFillers[price] for price in askPrices if price in sellFillers}, {price: buyFillers[price] for price in bidPrices if price in buyFillers})
+
+        if obj.mkt_ex_mode == False:
+            hooks.ticker(obj, obj.arr[0].rate)
+        hooks.order_book(obj)
+
+    def linear_price():
+        if len(obj.arr) > 1:
+            price_diff = round(obj.arr[1].rate - obj.arr[0].rate, 1)
+            if abs(price_diff) > 0.3:
+                factor = abs(price_diff)*10 - 1
+                i = 1 if price_diff>0 else -1
+
+                time_diff = obj.arr[1].time - obj.arr[0].time
+                time_diff = time_diff.total_seconds()
+
+                def next_rate(i):
+                    return round(obj.arr[0].rate + 0.1*i, 1)
+                
+                while True:
+                    flag = 0
+                    while next_rate(i) != obj.arr[1].rate:
+                        if next_rate(i) in obj.book:
+                            i = i+1 if i>0 else i-1
+                            flag = 1
+                            factor += 1
+                        if(flag == 0):
+                            break
+                        flag = 0
+                    if next_rate(i) == obj.arr[1].rate:
+                        break
+                    obj.sellOB.clear()
+                    obj.buyOB.clear()
+                    # print("--------------------------------")
+                    genOB(next_rate(i))
+                    i = i+1 if i>0 else i-1
+
+                    # if there are open market orders of this symbol
+                    if obj.mktOrders:
+                        MKT_execute(obj)
+                        obj.mkt_ex_mode = True
+
+                    else:
+                        if len(obj.inbox) > 0 or obj.mkt_ex_mode == True:
+                            if time_diff/factor > 1:
+                                yield 1
+                            else:
+                                yield time_diff/factor
+                        else:
+                            if time_diff/factor > 2:
+                                yield time_diff/factor
+                            else:
+                                yield 2
+                obj.mkt_ex_mode = False
+
+    def matchOrder():
+        if obj.buyOB[0][2] == obj.sellOB[0][2]: # when top bid & ask price match
+            price = obj.buyOB[0][2]
+            y = obj.book.head(price) # first order of that price
+            if y is not None:
+                # Add data to database
+                hooks.record(y.to_dict())
+
+                yield from linear_price()
+
+                obj.book.popleft(price) # delete first order of that price (and the price itself once empty)
+                del obj.arr[0]
+
+    
+    obj.load() # its trades are needed from here on
+
+    hooks.emit('stock_list', {'ltp': obj.arr[0].rate, 'sym': obj.symbol, 'scripName': obj.name, 'prevClose': obj.prevClose})
+
+    if obj.symbol == symbol: # for default asset to display
+            hooks.emit('display_asset', {'sym': symbol})
+
+    sym = obj.symbol
+    while len(obj.arr) != 0:
+        LMT_fill(obj)
+        genOB(obj.arr[0].rate)
+        yield from matchOrder()
+        # MKT orders take the current book on every tick, not only while the price walks
+        if obj.mktOrders and obj.arr:
+            MKT_execute(obj)
+        obj.sellOB.clear()
+        obj.buyOB.clear()
+        # apply the orders received since the last tick (not during a tick: matchOrder holds on to the head of the book)
+        if obj.arr:
+            drain_inbox(obj)
+        yield 0 # let the other symbols run
+    print(sym, "Finished matching")
+    hooks.emit('finished_matching', {'sym': sym})
+
+
+# queue a user's LMT order in the asset's book, only called from the asset's task (filled by LMT_fill once the price reaches it)
+def LMT_place(Rate, Qty, OrderNo, type, obj):
+    rand = random.choice(obj.arr) # the other side of the trade
+    if type == 'Buy':
+        OrderData = Trade('', genConID(OrderNo), 100, rand.sellerID, Qty, Rate, obj.arr[0].time, placedOrders[OrderNo][8], rand.sellerName, obj.symbol)
+    else:
+        OrderData = Trade('', genConID(OrderNo), rand.buyerID, 100, Qty, Rate, obj.arr[0].time, rand.buyerName, placedOrders[OrderNo][8], obj.symbol)
+    obj.book.add(OrderData, type)
+
+    obj.orderNos[OrderData.conID] = OrderNo # found by its contractID when filled, by its OrderNo when cancelled
+    placedOrders[OrderNo][6] = True
+    hooks.placed_orders(placedOrders[OrderNo][7])
@@ -0,0 +1,84 @@
+import csv
+import io
+
+from sqlalchemy import Index, inspect, text
+
+
+# rows returned by a single page when not asked for fewer
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# rows fetched from the database at a time while exporting
+EXPORT_CHUNK = 5000
+
+
+# composite indexes for the filtered queries, every one ends with id so that keyset pages stay index scans
+def floorsheet_indexes():
+    return (
+        Index('ix_price_row_symbol_id', 'symbol', 'id'),
+        Index('ix_price_row_buyer_id', 'buyerID', 'id'),
+        Index('ix_price_row_seller_id', 'sellerID', 'id'),
+    )
+
+
+# create_all() doesn't alter tables that already exist, columns added to the model later are added here
+def add_columns(model, engine):
+    existing = {column['name'] for column in inspect(engine).get_columns(model.__tablename__)}
+    with engine.begin() as connection:
+        for column in model.__table__.columns:
+            if column.name not in existing:
+                connection.execute(text(f'ALTER TABLE {model.__tablename__} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}'))
+
+
+# create_all() skips the indexes of tables that already exist
+def create_indexes(model, engine):
+    for index in model.__table__.indexes:
+        index.create(engine, checkfirst=True)
+
+
+# floorsheet query with the filters given in args (request.args or a dict)
+def filtered(model, args):
+    query = model.query
+    for name in ('symbol', 'buyerID', 'sellerID'):
+        if args.get(name):
+            query = query.filter(getattr(model, name) == args.get(name))
+    for name, column in (('minRate', model.rate), ('minQty', model.qty)):
+        if args.get(name) is not None:
+            query = query.filter(column >= float(args.get(name)))
+    for name, column in (('maxRate', model.rate), ('maxQty', model.qty)):
+        if args.get(name) is not None:
+            query = query.filter(column <= float(args.get(name)))
+    return query
+
+
+# (after, limit) of a page request, limit clamped to 1..MAX_PAGE_SIZE (ValueError if they aren't integers or after is negative)
+def page_args(args):
+    after = int(args.get('after') or 0)
+    if after < 0:
+        raise ValueError(f"after must not be negative: {after}")
+    limit = min(max(int(args.get('limit') or PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    return after, limit
+
+
+# rows after the given id (keyset pagination), returns (rows as dicts, whether more rows follow)
+def page(model, args, after=0, limit=PAGE_SIZE):
+    rows = filtered(model, args).filter(model.id > after).order_by(model.id).limit(limit + 1).all()
+    return [row.to_dict() for row in rows[:limit]], len(rows) > limit
+
+
+# csv lines of all the filtered rows, read in chunks so that the table is never held in memory
+def export_csv(model, args):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    columns = [column.name for column in model.__table__.columns]
+    writer.writerow(columns)
+    after = 0
+    while True:
+        rows, more = page(model, args, after, EXPORT_CHUNK)
+        for row in rows:
+            writer.writerow([row[name] for name in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        if not more:
+            break
+        after = rows[-1]['id']
@@ -1,80 +1,35 @@
 from utils import TOP_BIDSASKS_NO
 
+from bisect import bisect_left, bisect_right
+
 # def no_circuit_break(x, prevClose):
 #     lower_bound = prevClose * 0.9
 #     upper_bound = prevClose * 1.1
 #     return lower_bound <= x <= upper_bound
 
-def genPrices(x, type, prices):
-    temp = [] # to store bid/ask prices within this funtion temporarily before passing to actual list
-    count = 0
+# bid/ask ladder around rate x: O(log n) to locate x in the sorted prices, then O(depth) to fill the levels
+def genPrices(x, type, prices, depth=TOP_BIDSASKS_NO):
+    idx = bisect_left(prices, x) # position of the 1st price >= x
+    found = idx < len(prices) and prices[idx] == x
+
     if type == 'bids':
-        for idx, price in enumerate(prices):
-            if x == price:
-                while idx >= 0 and count != TOP_BIDSASKS_NO:
-                    temp.append(prices[idx])
-                    idx -= 1
-                    count += 1
-                if count != TOP_BIDSASKS_NO:
-                    # while count != TOP_BIDSASKS_NO and no_circuit_break(temp[count-1]-1, prevClose):
-                    while count != TOP_BIDSASKS_NO:
-                        temp.append(temp[count-1]-1)
-                        count += 1
-                break
-            elif price > x:
-                temp.append(x)
-                count += 1
-                if idx == 0:
-                    # while count != TOP_BIDSASKS_NO and no_circuit_break(temp[count-1]-1, prevClose):
-                    while count != TOP_BIDSASKS_NO:
-                        temp.append(temp[count-1]-1)
-                        count += 1
-                else:
-                    idx -= 1
-                    while idx >= 0 and count != TOP_BIDSASKS_NO:
-                        temp.append(prices[idx])
-                        idx -= 1
-                        count += 1
-                    if count != TOP_BIDSASKS_NO:
-                        # while count != TOP_BIDSASKS_NO and no_circuit_break(temp[count-1]-1, prevClose):
-                        while count != TOP_BIDSASKS_NO:
-                            temp.append(temp[count-1]-1)
-                            count += 1
-                break
+        if found:
+            temp = prices[max(idx-depth+1, 0):idx+1][::-1] # x and the prices below it
+        else:
+            temp = [x] + prices[max(idx-depth+1, 0):idx][::-1]
+        # while len(temp) != depth and no_circuit_break(temp[-1]-1, prevClose):
+        while len(temp) != depth:
+            temp.append(temp[-1]-1)
         return temp
     
     elif(type == 'asks'):
-        for idx, price in enumerate(prices):
-            if x == price:
-                while idx < len(prices) and count != TOP_BIDSASKS_NO:
-                    temp.append(prices[idx])
-                    idx += 1
-                    count += 1
-                if count != TOP_BIDSASKS_NO:
-                    # while count != TOP_BIDSASKS_NO and no_circuit_break(temp[count-1]+1, prevClose):
-                    while count != TOP_BIDSASKS_NO:
-                        temp.append(temp[count-1]+1)
-                        count += 1
-                break
-            elif price > x:
-                temp.append(round(x+0.2, 1)) # making a spread of 0.2
-                count += 1
-                if idx == len(prices)-1:
-                    # while count != TOP_BIDSASKS_NO and no_circuit_break(temp[count-1]+1, prevClose):
-                    while count != TOP_BIDSASKS_NO:
-                        temp.append(temp[count-1]+1)
-                        count += 1
-                else:
-                    if temp[0] == prices[idx]:
-                        idx +=1
-                    while idx < len(prices) and count != TOP_BIDSASKS_NO:
-                        temp.append(prices[idx])
-                        idx += 1
-                        count += 1
-                    if count != TOP_BIDSASKS_NO:
-                        # while count != TOP_BIDSASKS_NO and no_circuit_break(temp[count-1]+1, prevClose):
-                        while count != TOP_BIDSASKS_NO:
-                            temp.append(temp[count-1]+1)
-                            count += 1
-                break
+        if found:
+            temp = prices[idx:idx+depth] # x and the prices above it
+        else:
+            temp = [round(x+0.2, 1)] # making a spread of 0.2
+            idx = bisect_right(prices, temp[0]) # only the prices above it, so that the levels stay unique & ascending
+            temp += prices[idx:idx+depth-1]
+        # while len(temp) != depth and no_circuit_break(temp[-1]+1, prevClose):
+        while len(temp) != depth:
+            temp.append(temp[-1]+1)
         return temp
\ No newline at end of file
@@ -0,0 +1,164 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+
+from sqlalchemy import event, insert
+
+
+# attempts to commit a batch, the delay (sec) between them doubles after each failure
+WRITE_ATTEMPTS = 3
+RETRY_DELAY = 0.1
+# batches that still couldn't be committed are appended here (a json row per line), so that no trade is lost
+FAILED_FILE = 'journal-failed.jsonl'
+
+
+# apply the configured SQLite journal mode & synchronous level on every new connection
+def configure_sqlite(app, db):
+    journal_mode = app.config.get("SQLITE_JOURNAL_MODE")
+    synchronous = app.config.get("SQLITE_SYNCHRONOUS")
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if journal_mode:
+            cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        if synchronous:
+            cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.close()
+
+    with app.app_context():
+        event.listen(db.engine, "connect", set_pragmas)
+
+
+class TradeJournal():
+    def __init__(self, app, db, model, batch_size=500, flush_ms=50, run_blocking=None) -> None:
+        self.app = app
+        self.db = db
+        self.table = model.__table__
+        # rows waiting to be written, drained by a single writer thread
+        self.queue = queue.Queue()
+        # max. rows written per commit
+        self.batch_size = batch_size
+        # max. time (sec) a row waits in the queue before its batch is committed
+        self.flush_interval = flush_ms / 1000
+        # callbacks receiving the committed rows (as dicts, including their id) of every batch
+        self.listeners = []
+        # runs the database work of a batch (a real OS thread's pool under eventlet/gevent, where the writer is a greenlet)
+        self.run_blocking = run_blocking or (lambda fn, *args: fn(*args))
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.closed = False
+
+
+    def start(self):
+        self.requeue_failed()
+        self.thread.start()
+        atexit.register(self.close) # flush whatever is left when the interpreter exits
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    # queue a row (dict of column values) for writing
+    def put(self, row):
+        self.queue.put(row)
+
+    # queue several rows that are written in the same batch
+    def put_many(self, rows):
+        self.queue.put(list(rows))
+
+
+    # write all queued rows and stop the writer
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+
+    def run(self):
+        stop = False
+        while not stop:
+            batch = []
+            row = self.queue.get() # wait for the first row of the batch
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if row is None: # close() was called
+                    stop = True
+                    break
+                if isinstance(row, list):
+                    batch.extend(row)
+                else:
+                    batch.append(row)
+                if len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if batch:
+                self.write(batch)
+
+
+    # insert & commit a batch, returns the rows inserted
+    def insert(self, batch):
+        with self.app.app_context():
+            try:
+                # rows with an already existing conID are skipped instead of failing the whole batch
+                stmt = insert(self.table).prefix_with("OR IGNORE").returning(*self.table.c)
+                rows = [dict(row._mapping) for row in self.db.session.execute(stmt, batch)]
+                self.db.session.commit()
+                return rows
+            except Exception:
+                self.db.session.rollback()
+                raise
+
+
+    def write(self, batch):
+        delay = RETRY_DELAY
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                rows = self.run_blocking(self.insert, batch)
+                break
+            except Exception as e:
+                print(f"Error: {str(e)} (batch of {len(batch)} trades, attempt {attempt}/{WRITE_ATTEMPTS})")
+                if attempt == WRITE_ATTEMPTS:
+                    self.set_aside(batch)
+                    return
+                time.sleep(delay)
+                delay *= 2
+
+        for listener in self.listeners:
+            try:
+                listener(rows)
+            except Exception:
+                traceback.print_exc() # the other listeners & the writer keep going
+
+
+    # batches set aside by an earlier run are written first (rows already in the database are skipped by their conID)
+    def requeue_failed(self):
+        try:
+            with open(FAILED_FILE, 'r') as file:
+                rows = [json.loads(line) for line in file if line.strip()]
+        except FileNotFoundError:
+            return
+        os.remove(FAILED_FILE) # set aside again if they still fail
+        if rows:
+            print(f"Requeueing {len(rows)} trades from {FAILED_FILE}")
+            self.put_many(rows)
+
+
+    # keep a batch that couldn't be committed, to be inserted again later (see requeue_failed())
+    def set_aside(self, batch):
+        try:
+            with open(FAILED_FILE, 'a') as file:
+                for row in batch:
+                    file.write(json.dumps(row) + '\n')
+            print(f"{len(batch)} trades written to {FAILED_FILE}")
+        except Exception:
+            traceback.print_exc()
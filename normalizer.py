@@ -1,4 +1,5 @@
 import networkx as nx
+import numpy as np
 import json
 
 class TransactionGraph:
@@ -47,4 +48,45 @@ class TransactionGraph:
         for u, v, data in self.graph.edges(data=True):
             edges.append({"source": u, "target": v, "qty": data['qty']})
         return edges
-    
+
+    def multilateral(self):
+        """Net every broker to a single position and settle the positions with a minimal set of transfers (cancels cycles of any length)."""
+        edges = list(self.graph.edges(data='qty'))
+        if not edges:
+            return []
+        buyers, sellers, qtys = zip(*edges)
+        return minimal_transfers(*net_positions(buyers, sellers, qtys))
+
+
+def net_positions(buyers, sellers, qtys):
+    """Net position of every broker from arrays of transactions: qty bought minus qty sold. Returns (broker ids, positions)."""
+    n = len(buyers)
+    ids, idx = np.unique(np.concatenate([np.asarray(buyers), np.asarray(sellers)]), return_inverse=True)
+    qtys = np.asarray(qtys)
+    net = np.bincount(idx[:n], weights=qtys, minlength=len(ids)) - np.bincount(idx[n:], weights=qtys, minlength=len(ids))
+    if np.issubdtype(qtys.dtype, np.integer):
+        net = net.astype(np.int64)
+    return ids, net
+
+
+def minimal_transfers(ids, net):
+    """Settle the net positions greedily: net buyers (largest first) pay net sellers (largest first), in at most (brokers - 1) transfers."""
+    payers = np.argsort(-net, kind='stable')
+    payers = payers[net[payers] > 0]
+    receivers = np.argsort(net, kind='stable')
+    receivers = receivers[net[receivers] < 0]
+    if len(payers) == 0 or len(receivers) == 0:
+        return []
+
+    # lay both sides end to end on one line, every piece between two consecutive boundaries is a transfer
+    paid = np.cumsum(net[payers])
+    received = np.cumsum(-net[receivers])
+    ends = np.union1d(paid, received)
+    ends = ends[ends <= min(paid[-1], received[-1])]
+    starts = np.concatenate([np.zeros(1, ends.dtype), ends[:-1]])
+    src = payers[np.searchsorted(paid, starts, side='right')]
+    dst = receivers[np.searchsorted(received, starts, side='right')]
+    amounts = ends - starts
+
+    ids = ids.tolist()
+    return [{"source": ids[u], "target": ids[v], "qty": qty} for u, v, qty in zip(src.tolist(), dst.tolist(), amounts.tolist()) if qty > 0]
@@ -0,0 +1,149 @@
+from bisect import bisect_left, insort
+from collections import deque
+from itertools import islice
+
+
+class OrderBook():
+    def __init__(self) -> None:
+        # unique prices in ascending order, searched with bisect
+        self.prices = []
+        # FIFO queue of orders resting at each price
+        self.levels = {}
+        # handle of every live cancellable (user's) order in the book: contractID -> (order, side)
+        self.orders = {}
+        # no. of live orders at each price
+        self.counts = {}
+        # cancelled orders (by object id) that still sit in a deque until they reach its front
+        self.cancelled = set()
+        # live user's orders of each side: price -> FIFO queue, along with their unique prices in ascending order
+        self.bids = {}; self.bidPrices = []
+        self.asks = {}; self.askPrices = []
+
+
+    def __contains__(self, price):
+        return price in self.levels
+
+
+    # highest price of the user's buy orders (None if there are none)
+    @property
+    def best_bid(self):
+        return self.bidPrices[-1] if self.bidPrices else None
+
+    # lowest price of the user's sell orders (None if there are none)
+    @property
+    def best_ask(self):
+        return self.askPrices[0] if self.askPrices else None
+
+
+    def side(self, side):
+        return (self.bids, self.bidPrices) if side == 'Buy' else (self.asks, self.askPrices)
+
+
+    # queue a user's order ('Buy'/'Sell' side) at the back of its price level
+    def add(self, order, side):
+        price = order.rate
+        level = self.levels.get(price)
+        if level is None:
+            level = self.levels[price] = deque()
+            self.counts[price] = 0
+            insort(self.prices, price)
+        level.append(order)
+        self.orders[order.conID] = (order, side)
+        self.counts[price] += 1
+
+        queues, prices = self.side(side)
+        queue = queues.get(price)
+        if queue is None:
+            queue = queues[price] = deque()
+            insort(prices, price)
+        queue.append(order)
+
+
+    # fill an empty book in a single pass, orders must be in time order
+    # (no handles are kept for these, only orders placed with add() can be cancelled)
+    def load(self, orders):
+        for order in orders:
+            price = order.rate
+            level = self.levels.get(price)
+            if level is None:
+                level = self.levels[price] = deque()
+                self.counts[price] = 0
+            level.append(order)
+            self.counts[price] += 1
+        self.prices[:] = sorted(self.levels)
+
+
+    # remove a user's order by its contractID, returns the removed order or None
+    def cancel(self, conID):
+        entry = self.orders.pop(conID, None)
+        if entry is None:
+            return None
+        order, side = entry
+        self.cancelled.add(id(order)) # its price level drops it once it reaches the front
+        price = order.rate
+        self.counts[price] -= 1
+        if self.counts[price] == 0:
+            self.drop_level(price)
+
+        queues, prices = self.side(side)
+        queue = queues[price]
+        queue.remove(order) # only the user's orders at that price are searched
+        if not queue:
+            del queues[price]
+            del prices[bisect_left(prices, price)]
+        return order
+
+
+    # remove and return the oldest user's order at the best price of a side (None if there are none)
+    def pop_best(self, side):
+        queues, prices = self.side(side)
+        if not prices:
+            return None
+        price = prices[-1] if side == 'Buy' else prices[0]
+        return self.cancel(queues[price][0].conID)
+
+
+    def drop_level(self, price):
+        for order in self.levels.pop(price):
+            self.cancelled.discard(id(order))
+        del self.counts[price]
+        idx = bisect_left(self.prices, price)
+        del self.prices[idx]
+
+
+    # live orders resting at a price in time priority
+    def level(self, price):
+        level = self.levels.get(price)
+        if level is None:
+            return iter(())
+        return (order for order in level if id(order) not in self.cancelled)
+
+
+    # first n live orders at a price
+    def head_n(self, price, n):
+        return islice(self.level(price), n)
+
+
+    # first live order at a price, discarding cancelled orders at the front of the level
+    def head(self, price):
+        level = self.levels.get(price)
+        if level is None:
+            return None
+        while level and id(level[0]) in self.cancelled:
+            self.cancelled.discard(id(level.popleft()))
+        return level[0] if level else None
+
+
+    # remove and return the first live order at a price
+    def popleft(self, price):
+        order = self.head(price)
+        if order is None:
+            return None
+        entry = self.orders.get(order.conID)
+        if entry is not None and entry[0] is order: # a user's order
+            return self.cancel(order.conID)
+        self.levels[price].popleft()
+        self.counts[price] -= 1
+        if self.counts[price] == 0:
+            self.drop_level(price)
+        return order
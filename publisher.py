@@ -0,0 +1,45 @@
+import threading
+import traceback
+
+
+# levels that are new or changed since the previously sent side of the book & prices no longer in it
+# (keyed by price, so that a price moving up or down the ladder isn't sent again; genPrices keeps the prices of a side unique & sorted)
+def book_diff(old, new):
+    prev = {level[2]: level for level in old}
+    changed = [level for level in new if prev.get(level[2]) != level]
+    prices = {level[2] for level in new}
+    removed = [price for price in prev if price not in prices]
+    return changed, removed
+
+
+class Outbox():
+    def __init__(self, socketio, frame_ms=50) -> None:
+        self.socketio = socketio
+        # time (sec) updates are held back & coalesced before being sent
+        self.frame = frame_ms / 1000
+        # latest pending update of every (channel, key), a newer post replaces the older one
+        self.pending = {}
+        self.lock = threading.Lock()
+
+
+    # queue an update, build() is called at the end of the frame and returns the (event, data, room) to send
+    def post(self, key, build):
+        with self.lock:
+            self.pending[key] = build
+
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for build in pending.values():
+            try:
+                for event, data, room in build():
+                    self.socketio.emit(event, data, room=room)
+            except Exception:
+                traceback.print_exc() # only this update is lost, the outbox keeps running
+
+
+    def run(self):
+        while True:
+            self.socketio.sleep(self.frame)
+            self.flush()
@@ -0,0 +1,59 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+
+class Scheduler():
+    def __init__(self, speed=1, sleep=time.sleep) -> None:
+        # replay speed multiplier: 1 is real-time, 10 is ten times faster, 0 replays as fast as possible
+        self.speed = speed
+        # function used to wait for the next task (overridable for servers with their own event loop)
+        self.sleep = sleep
+        # simulated seconds since the start of the replay
+        self.now = 0.0
+        # heap of (wake-up time, spawn order, task), ties are run in the order they were scheduled
+        self.tasks = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        # wall-clock & simulated time when the replay started
+        self.started = None
+
+
+    # schedule a generator task, each value it yields is the no. of (simulated) seconds it wants to sleep
+    def spawn(self, task, delay=0):
+        with self.lock:
+            heapq.heappush(self.tasks, (self.now + delay, next(self.counter), task))
+
+
+    # run the task that is due next, returns False once all tasks have finished
+    def step(self):
+        with self.lock:
+            if not self.tasks:
+                return False
+            wake, _, task = heapq.heappop(self.tasks)
+
+        if self.speed:
+            if self.started is None:
+                self.started = (time.monotonic(), self.now)
+            due = self.started[0] + (wake - self.started[1]) / self.speed
+            wait = due - time.monotonic()
+            # sleep(0) when already due still hands the loop to the server's other greenlets (eventlet/gevent)
+            self.sleep(wait if wait > 0 else 0)
+        self.now = max(self.now, wake)
+
+        try:
+            delay = next(task)
+        except StopIteration:
+            return True
+        except Exception:
+            traceback.print_exc() # the failed task is dropped, the others keep running
+            return True
+        self.spawn(task, delay or 0)
+        return True
+
+
+    def run(self):
+        while self.step():
+            pass
@@ -0,0 +1,120 @@
+import json
+import threading
+
+import numpy as np
+from sqlalchemy import func
+
+from normalizer import minimal_transfers
+
+
+# Net settlement obligations between brokers, kept up to date trade by trade (instead of recomputing from the floorsheet)
+class Settlement():
+    def __init__(self) -> None:
+        # net position of each pair of brokers (a, b) with a < b: symbol -> [qty, value]
+        # positive qty: a receives shares from b, positive value: a pays b
+        self.pairs = {}
+        # net position of each broker: id -> [value to pay (negative to receive), {symbol: qty to receive (negative to deliver)}]
+        self.brokers = {}
+        # no. of times the positions changed, lets readers cache what they derive from them
+        self.version = 0
+        self.lock = threading.Lock()
+        # serialized graphs of the current version: (mode, symbol, top) -> json
+        self.graphs = {}
+        self.graphsVersion = -1
+
+
+    def add(self, buyer, seller, sym, qty, value):
+        if buyer == seller:
+            return # crossed within the same broker, nothing to settle
+        a, b, sign = (buyer, seller, 1) if buyer < seller else (seller, buyer, -1)
+        pos = self.pairs.setdefault((a, b), {}).setdefault(sym, [0, 0.0])
+        pos[0] += sign * qty
+        pos[1] += sign * value
+        for broker, sign in ((buyer, 1), (seller, -1)):
+            net = self.brokers.setdefault(broker, [0.0, {}])
+            net[0] += sign * value
+            net[1][sym] = net[1].get(sym, 0) + sign * qty
+
+
+    # journal listener: committed rows of a batch
+    def update(self, rows):
+        with self.lock:
+            for row in rows:
+                self.add(str(row['buyerID']), str(row['sellerID']), row['symbol'], row['qty'], row['qty'] * row['rate'])
+            self.version += 1
+
+
+    # positions of the trades already in the database (aggregated by the database, call before the journal starts)
+    def seed(self, app, db, model):
+        with app.app_context():
+            totals = db.session.query(model.buyerID, model.sellerID, model.symbol, func.sum(model.qty), func.sum(model.qty * model.rate)) \
+                .group_by(model.buyerID, model.sellerID, model.symbol).all()
+        with self.lock:
+            for buyer, seller, sym, qty, value in totals:
+                self.add(str(buyer), str(seller), sym, qty, value)
+            self.version += 1
+
+
+    # net position of every broker (or only the given one)
+    def positions(self, broker=None):
+        with self.lock:
+            brokers = [broker] if broker is not None else sorted(self.brokers)
+            result = []
+            for id in brokers:
+                value, symbols = self.brokers.get(id, [0.0, {}])
+                result.append({'broker': id, 'value': round(value, 2), 'symbols': {sym: qty for sym, qty in symbols.items() if qty != 0}})
+            return result
+
+
+    # netted obligations between the pairs of brokers (involving the given broker, if any)
+    def obligations(self, broker=None, sym=None):
+        with self.lock:
+            result = []
+            for (a, b), symbols in self.pairs.items():
+                if broker is not None and broker != a and broker != b:
+                    continue
+                for s, (qty, value) in symbols.items():
+                    if sym is not None and s != sym:
+                        continue
+                    if qty == 0 and round(value, 2) == 0:
+                        continue
+                    # buyer (receives the shares) first
+                    if qty > 0 or (qty == 0 and value > 0):
+                        result.append({'buyer': a, 'seller': b, 'symbol': s, 'qty': qty, 'value': round(value, 2)})
+                    else:
+                        result.append({'buyer': b, 'seller': a, 'symbol': s, 'qty': -qty, 'value': round(-value, 2)})
+            return result
+
+
+    # netted qty edges {source: buyer, target: seller, qty} of one symbol (or all of them summed), largest first
+    #   bilateral: net of each pair of brokers, multilateral: each broker's net position settled in the fewest transfers
+    def edges(self, mode='bilateral', sym=None):
+        with self.lock:
+            if mode == 'multilateral':
+                ids = list(self.brokers)
+                net = np.array([symbols.get(sym, 0) if sym is not None else sum(symbols.values()) for _, symbols in self.brokers.values()], dtype=np.int64)
+                edges = minimal_transfers(np.array(ids, dtype=object), net)
+            else:
+                edges = []
+                for (a, b), symbols in self.pairs.items():
+                    qty = symbols.get(sym, [0])[0] if sym is not None else sum(pos[0] for pos in symbols.values())
+                    if qty > 0:
+                        edges.append({'source': a, 'target': b, 'qty': qty})
+                    elif qty < 0:
+                        edges.append({'source': b, 'target': a, 'qty': -qty})
+        edges.sort(key=lambda edge: edge['qty'], reverse=True)
+        return edges
+
+
+    # the graph as json, rebuilt only after new trades changed the positions
+    def graph(self, mode='bilateral', sym=None, top=None):
+        key = (mode, sym, top)
+        version = self.version
+        if self.graphsVersion != version:
+            self.graphs = {}
+            self.graphsVersion = version
+        body = self.graphs.get(key)
+        if body is None:
+            body = json.dumps(self.edges(mode, sym)[:top], separators=(',', ':'))
+            self.graphs[key] = body
+        return body, version
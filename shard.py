@@ -0,0 +1,119 @@
+# Runs the simulation of a subset of the assets in worker processes, so that it isn't capped at one core by the GIL.
+# The front process (app.py) starts the workers with ShardPool, routes orders to them and receives their events.
+import os
+import subprocess
+import sys
+import threading
+from multiprocessing.connection import Client, Listener
+
+
+class ShardPool():
+    def __init__(self, count) -> None:
+        # no. of worker processes, worker k simulates every count-th asset starting at k
+        self.count = count
+        self.authkey = os.urandom(16)
+        self.listener = Listener(('localhost', 0), authkey=self.authkey)
+        # connection to each worker
+        self.conns = [None] * count
+        self.procs = []
+        self.lock = threading.Lock()
+
+
+    def start(self):
+        host, port = self.listener.address
+        for k in range(self.count):
+            env = dict(os.environ, SHARD=f"{k}/{self.count}", SHARD_ADDRESS=f"{host}:{port}", SHARD_AUTHKEY=self.authkey.hex())
+            self.procs.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env))
+        for _ in range(self.count):
+            conn = self.listener.accept()
+            self.conns[conn.recv()] = conn # workers introduce themselves with their index
+
+
+    # no. of the worker simulating the asset with the given id
+    def shard_of(self, id):
+        return id % self.count
+
+    def send(self, k, msg):
+        with self.lock:
+            self.conns[k].send(msg)
+
+    def broadcast(self, msg):
+        for k in range(self.count):
+            self.send(k, msg)
+
+
+    # pass every event of worker k to handle(msg) until the worker finishes
+    def listen(self, k, handle):
+        while True:
+            try:
+                msg = self.conns[k].recv()
+            except (EOFError, OSError):
+                return
+            handle(msg)
+
+
+    def close(self):
+        for proc in self.procs:
+            proc.terminate()
+        self.listener.close()
+
+
+# worker process: simulates its assets and reports through the connection to the front process
+def worker():
+    index = int(os.environ['SHARD'].split('/')[0])
+    host, port = os.environ['SHARD_ADDRESS'].rsplit(':', 1)
+    conn = Client((host, int(port)), authkey=bytes.fromhex(os.environ['SHARD_AUTHKEY']))
+    conn.send(index)
+
+    import engine # loads only this shard's assets (see utils.SHARD_INDEX)
+    from scheduler import Scheduler
+
+    lock = threading.Lock()
+
+    def send(*msg):
+        with lock:
+            conn.send(msg)
+
+    engine.hooks.record = lambda row: send('record', row)
+    engine.hooks.records = lambda rows: send('records', rows)
+    engine.hooks.ticker = lambda obj, ltp: send('ticker', obj.symbol, ltp)
+    engine.hooks.order_book = lambda obj: send('order_book', obj.symbol, obj.sellOB, obj.buyOB)
+    engine.hooks.placed_orders = lambda username: send('placed_orders', index, username, engine.orders_of(username))
+    engine.hooks.deduct = lambda username, amt: send('deduct', username, amt)
+    engine.hooks.refund = lambda username, sym, qty, amt: send('refund', username, sym, qty, amt)
+    engine.hooks.emit = lambda event, data: send('emit', event, data)
+
+    scheduler = Scheduler(engine.SIM_SPEED)
+    for obj in engine.assets:
+        scheduler.spawn(engine.orderMatch_sim(obj))
+    if engine.PREWARM_ASSETS:
+        threading.Thread(target=engine.prewarm, daemon=True).start()
+
+    event_start = threading.Event()
+
+    # commands from the front process
+    def receive():
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                os._exit(0) # front process is gone
+            if msg[0] == 'start':
+                event_start.set()
+            elif msg[0] == 'place':
+                engine.place(*msg[1:])
+            elif msg[0] == 'cancel':
+                engine.cancel(*msg[1:])
+            elif msg[0] == 'amend':
+                engine.amend(*msg[1:])
+            elif msg[0] == 'load':
+                if msg[1] in engine.registry:
+                    engine.registry[msg[1]].load()
+
+    threading.Thread(target=receive, daemon=True).start()
+    event_start.wait() # until the first client connects to the front process
+    scheduler.run()
+
+
+if __name__ == "__main__":
+    worker()
@@ -13,13 +13,23 @@ document.addEventListener('DOMContentLoaded', function() {
 
     var lastSellOB = sessionStorage.getItem('lastSellOB') ? JSON.parse(sessionStorage.getItem('lastSellOB')) || [] : []; 
     var lastBuyOB = sessionStorage.getItem('lastBuyOB') ? JSON.parse(sessionStorage.getItem('lastBuyOB')) || [] : [];
+    var bookSeq = null;  // seq no. of the last applied order book update (null until a snapshot arrives)
+    var bookRequested = false;  // while a snapshot is being requested
     
-    var lastDatabase = sessionStorage.getItem('lastDatabase') ? JSON.parse(sessionStorage.getItem('lastDatabase')) || [] : [];
+    // floorsheet rows are stored as a base array ('lastDatabase') plus the batches appended since ('floorsheet:0', 'floorsheet:1', ...),
+    // so that a delta only serializes its own rows, the batches are folded into the base every FLOORSHEET_COMPACT_EVERY batches
+    var FLOORSHEET_COMPACT_EVERY = 200;
+    var floorsheetBatches = parseInt(sessionStorage.getItem('floorsheetBatches')) || 0;  // no. of stored batches
+    var lastDatabase = load_FloorsheetStore();
+    var floorsheetSeq = sessionStorage.getItem('floorsheetSeq') ? parseInt(sessionStorage.getItem('floorsheetSeq')) : 0;  // seq no. of the last applied floorsheet delta
+    var floorsheetSyncing = false;  // while catch-up pages are being fetched
     
     var placedOrders = sessionStorage.getItem('placedOrders') ? JSON.parse(sessionStorage.getItem('placedOrders')) || [] : [];
     
-    let lastCheckTime = sessionStorage.getItem('lastCheckTime') ? sessionStorage.getItem('lastCheckTime') : Date.now();
-    var labels = sessionStorage.getItem('labels') ? JSON.parse(sessionStorage.getItem('labels')) || [] : [];  // For x-axis labels (timestamps)
+    var CHART_INTERVAL = '1m';  // bars plotted on the chart (1s, 1m or 5m)
+    var labels = [];  // For x-axis labels (timestamps)
+    var chartCloses = [];  // previous day's close, then the close of every bar of the displayed asset
+    var chartTimes = [];  // start time of every plotted bar
     
     var ctx = document.getElementById('priceChart').getContext('2d');  // Get the canvas context for drawing the chart
 
@@ -59,13 +69,6 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
-    // Collateral deduction request from server for market orders
-    socket.on("deduct_req", function (data) {
-        let amt = data.amt
-        socket.emit('deduct_buy', { amt });
-    });
-
-
     function load_exploreTab() {
         // Get the class 'explore' element
         const exploreElement = document.querySelector('.explore');
@@ -126,11 +129,12 @@ document.addEventListener('DOMContentLoaded', function() {
     
                 lastBuyOB = [];
                 lastSellOB = [];
+                bookSeq = null;
                 sessionStorage.setItem('lastSellOB', JSON.stringify(lastSellOB));
                 sessionStorage.setItem('lastBuyOB', JSON.stringify(lastBuyOB));
                 document.getElementById('order-book-table-body').innerHTML = '';
                 
-                updateChart(symbol);
+                load_Chart();
                 load_Floorsheet();
             });
     
@@ -147,12 +151,20 @@ document.addEventListener('DOMContentLoaded', function() {
         load_exploreTab();
     });
 
+    // (Re)subscribe to the order book of the displayed asset
+    socket.on('connect', function() {
+        if (symbol) socket.emit('scrip_selected', { scrip: symbol });
+        load_Chart();  // bars missed while disconnected
+    });
+
     socket.on('display_asset', function(data) {
         symbol = data.sym;
         
         sessionStorage.setItem('symbol', symbol);
+        socket.emit('scrip_selected', { scrip: symbol });
 
         load_topbar();
+        load_Chart();
     });
     
     function load_topbar() {
@@ -242,24 +254,6 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     } load_OrderBook();
 
-    function ext_pricePlots(sym) {
-        if (!sym) {
-            for (let x of dataMat) {
-                if (x[1] == symbol) {
-                    return x[4];
-                }
-            }
-            return [];
-        }
-        else {
-            for (let x of dataMat) {
-                if (x[1] == sym) {
-                    return [x[0], x[3], x[4]];
-                }
-            }
-        }
-    }
-    
     // Create a real-time line chart
     var priceChart = new Chart(ctx, {
         type: 'line',
@@ -267,16 +261,14 @@ document.addEventListener('DOMContentLoaded', function() {
             labels: labels,  // X-axis labels
             datasets: [{
                 label: 'Stock Price',  // Name of the dataset
-                data: ext_pricePlots(),  // Y-axis data for LTP arr
+                data: chartCloses,  // Y-axis data for the close of each bar
                 borderColor: function() {
-                    pricePlots = ext_pricePlots();
                     // if price is above day's open then green else red
-                    return pricePlots[pricePlots.length - 1] >= pricePlots[1] ? 'rgba(0, 200, 0, 1)' : 'rgba(200, 0, 0, 1)';
+                    return chartCloses[chartCloses.length - 1] >= chartCloses[0] ? 'rgba(0, 200, 0, 1)' : 'rgba(200, 0, 0, 1)';
                 },  // Line color
                 backgroundColor: function() {
                     var gradient = ctx.createLinearGradient(0, 0, 0, 400);  // Create a gradient background for the line
-                    pricePlots = ext_pricePlots();
-                    if (pricePlots[pricePlots.length - 1] >= pricePlots[1]) {  // if price is above day's open then green else red
+                    if (chartCloses[chartCloses.length - 1] >= chartCloses[0]) {  // if price is above day's open then green else red
                         // Green gradient for upward trend
                         gradient.addColorStop(0, 'rgba(0, 200, 0, 0.3)');
                         gradient.addColorStop(1, 'rgba(0, 200, 0, 0)');
@@ -290,20 +282,17 @@ document.addEventListener('DOMContentLoaded', function() {
                 borderWidth: 2,  // Line width
                 fill: true,  // Don't fill the area under the line
                 pointRadius: function(context) {
-                    pricePlots = ext_pricePlots();
                     // Show a point only on the last data point
-                    return context.dataIndex === pricePlots.length - 1 ? 5 : 0;
+                    return context.dataIndex === chartCloses.length - 1 ? 5 : 0;
                 },
                 pointHoverRadius: 3,  // Hover effect on the last point
                 pointBackgroundColor: function() {
-                    pricePlots = ext_pricePlots();
                     // if price is above day's open then green else red
-                    return pricePlots[pricePlots.length - 1] >= pricePlots[1] ? 'rgba(0, 200, 0, 1)' : 'rgba(200, 0, 0, 1)';
+                    return chartCloses[chartCloses.length - 1] >= chartCloses[0] ? 'rgba(0, 200, 0, 1)' : 'rgba(200, 0, 0, 1)';
                 },  // Color for the last point
                 pointBorderWidth: function(context) {
-                    pricePlots = ext_pricePlots();
                     // Make the last point thicker
-                    return context.dataIndex === pricePlots.length - 1 ? 1 : 0;
+                    return context.dataIndex === chartCloses.length - 1 ? 1 : 0;
                 }
             }]
         },
@@ -356,91 +345,145 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
-    function load_Floorsheet() {
-        var floorsheetTableBody = document.getElementById('floorsheet-table-body');
-        floorsheetTableBody.innerHTML = '';  // Clear current floorsheet table content
+    function floorsheetRow(entry) {
+        var row = document.createElement('tr');
 
-        // Use provided database or fallback to last known database
-        var floorsheetData = lastDatabase.slice().reverse();
+        // Calculate amount = qty * rate
+        var amount = entry.qty * entry.rate;
 
-        // Insert rows for floorsheet with updated format
-        floorsheetData.forEach(function(entry) {
-            var row = document.createElement('tr');
-            
-            if (entry.symbol == symbol) {
-                // Calculate amount = qty * rate
-                var amount = entry.qty * entry.rate;
+        // Add cells for each column
+        var idCell = document.createElement('td');
+        idCell.textContent = entry.id;
+        row.appendChild(idCell);
 
-                // Add cells for each column
-                var idCell = document.createElement('td');
-                idCell.textContent = entry.id;
-                row.appendChild(idCell);
+        var conIDCell = document.createElement('td');
+        conIDCell.textContent = entry.conID;
+        row.appendChild(conIDCell);
 
-                var conIDCell = document.createElement('td');
-                conIDCell.textContent = entry.conID;
-                row.appendChild(conIDCell);
+        var qtyCell = document.createElement('td');
+        qtyCell.textContent = entry.qty;
+        row.appendChild(qtyCell);
 
-                var qtyCell = document.createElement('td');
-                qtyCell.textContent = entry.qty;
-                row.appendChild(qtyCell);
+        var rateCell = document.createElement('td');
+        rateCell.textContent = entry.rate;
+        row.appendChild(rateCell);
 
-                var rateCell = document.createElement('td');
-                rateCell.textContent = entry.rate;
-                row.appendChild(rateCell);
+        var amountCell = document.createElement('td');
+        amountCell.textContent = amount.toFixed(2);  // Keep 2 decimal places for amount
+        row.appendChild(amountCell);
 
-                var amountCell = document.createElement('td');
-                amountCell.textContent = amount.toFixed(2);  // Keep 2 decimal places for amount
-                row.appendChild(amountCell);
+        var buyerNameCell = document.createElement('td');
+        buyerNameCell.textContent = entry.buyerName;
+        row.appendChild(buyerNameCell);
 
-                var buyerNameCell = document.createElement('td');
-                buyerNameCell.textContent = entry.buyerName;
-                row.appendChild(buyerNameCell);
+        var sellerNameCell = document.createElement('td');
+        sellerNameCell.textContent = entry.sellerName;
+        row.appendChild(sellerNameCell);
 
-                var sellerNameCell = document.createElement('td');
-                sellerNameCell.textContent = entry.sellerName;
-                row.appendChild(sellerNameCell);
+        return row;
+    }
 
-                floorsheetTableBody.appendChild(row);
+    function load_Floorsheet() {
+        var floorsheetTableBody = document.getElementById('floorsheet-table-body');
+        floorsheetTableBody.innerHTML = '';  // Clear current floorsheet table content
+
+        // Use provided database or fallback to last known database
+        var floorsheetData = lastDatabase.slice().reverse();
+
+        // Insert rows for floorsheet with updated format
+        floorsheetData.forEach(function(entry) {
+            if (entry.symbol == symbol) {
+                floorsheetTableBody.appendChild(floorsheetRow(entry));
             }
         });
     } load_Floorsheet();
 
-    function updateChart(sym) {
-        const currentTime = Date.now();
-        pricePlots = ext_pricePlots(sym);  // [LTP, PrevClose, chart-plots]
+    // Add only the new rows on top of the floorsheet table (newest first)
+    function append_Floorsheet(rows) {
+        var floorsheetTableBody = document.getElementById('floorsheet-table-body');
+        var lastID = lastDatabase.length ? lastDatabase[lastDatabase.length - 1].id : 0;
+        var added = [];
 
-        // if time within 1 minu. interval
-        if (currentTime-lastCheckTime < 60000) {
-            // Add the new LTP value to the chart data
-            if (pricePlots[2].length == 0){
-                pricePlots[2].push(pricePlots[1]);  // fill first index of chart as previous closing price
-                pricePlots[2].push(pricePlots[0]);  // fill second index of chart as the first LTP of the day
-            }
-            else pricePlots[2][pricePlots[2].length - 1] = pricePlots[0];  // fill rest of the indices of chart as incoming LTPs
-            sessionStorage.setItem('dataMat', JSON.stringify(dataMat));
-            
-            // Add label (time for the x-axis)
-            if (labels.length == 0) {
-                labels.push('');  // this label is empty for the previous day's close which is the first plotted price on chart
-                labels.push(new Date().toLocaleTimeString());  // print time label
-                labels.push('');  // leave a gap from last plotted price
-                sessionStorage.setItem('labels', JSON.stringify(labels));
+        rows.forEach(function(entry) {
+            if (entry.id <= lastID) return;  // already received
+            lastDatabase.push(entry);
+            lastID = entry.id;
+            if (entry.symbol == symbol) {
+                floorsheetTableBody.insertBefore(floorsheetRow(entry), floorsheetTableBody.firstChild);
             }
-        }
+            added.push(entry);
+        });
+        if (added.length) save_FloorsheetBatch(added);
+    }
 
-        // if 1 minu. interval finished
-        else {
-            lastCheckTime = currentTime;
-            labels[labels.length-1] = new Date().toLocaleTimeString();
-            labels.push('');
-            dataMat.forEach(x => {
-                x[4].push(x[0]);
+    // rows of the stored base & batches (rows already seen are skipped, in case a compaction got interrupted)
+    function load_FloorsheetStore() {
+        var rows = sessionStorage.getItem('lastDatabase') ? JSON.parse(sessionStorage.getItem('lastDatabase')) || [] : [];
+        var lastID = rows.length ? rows[rows.length - 1].id : 0;
+        for (var k = 0; k < floorsheetBatches; k++) {
+            (JSON.parse(sessionStorage.getItem('floorsheet:' + k)) || []).forEach(function(entry) {
+                if (entry.id <= lastID) return;
+                rows.push(entry);
+                lastID = entry.id;
             });
-            sessionStorage.setItem('lastCheckTime', lastCheckTime);
-            sessionStorage.setItem('dataMat', JSON.stringify(dataMat));
-            sessionStorage.setItem('labels', JSON.stringify(labels));
         }
-        if (sym == symbol)  priceChart.update();
+        return rows;
+    }
+
+    // store the rows just appended to lastDatabase
+    function save_FloorsheetBatch(rows) {
+        if (floorsheetBatches >= FLOORSHEET_COMPACT_EVERY) {
+            compact_FloorsheetStore();
+            return;
+        }
+        sessionStorage.setItem('floorsheet:' + floorsheetBatches, JSON.stringify(rows));
+        floorsheetBatches++;
+        sessionStorage.setItem('floorsheetBatches', floorsheetBatches);
+    }
+
+    // store the whole lastDatabase as the base, dropping the batches
+    function compact_FloorsheetStore() {
+        sessionStorage.setItem('lastDatabase', JSON.stringify(lastDatabase));
+        var count = floorsheetBatches;
+        floorsheetBatches = 0;
+        sessionStorage.setItem('floorsheetBatches', floorsheetBatches);
+        for (var k = 0; k < count; k++) {
+            sessionStorage.removeItem('floorsheet:' + k);
+        }
+    }
+
+    // Request rows missed since the last known row (after a gap or reconnect)
+    function sync_Floorsheet() {
+        floorsheetSyncing = true;
+        var lastID = lastDatabase.length ? lastDatabase[lastDatabase.length - 1].id : 0;
+        socket.emit('floorsheet_sync', { after: lastID });
+    } sync_Floorsheet();
+
+    // Plot a bar, or update the last plotted one if it's the same bar
+    function add_Bar(bar) {
+        if (chartTimes.length && chartTimes[chartTimes.length - 1] == bar[0]) {
+            chartCloses[chartCloses.length - 1] = bar[4];
+            return;
+        }
+        chartTimes.push(bar[0]);
+        chartCloses.push(bar[4]);
+        labels.push(new Date(bar[0] * 1000).toLocaleTimeString());
+    }
+
+    // Fetch the bars of the displayed asset from the server (after selecting an asset, a refresh or a reconnect)
+    function load_Chart() {
+        if (!symbol) return;
+        $.getJSON('/api/candles', { symbol: symbol, interval: CHART_INTERVAL }, function(data) {
+            if (data.sym != symbol) return;  // another asset got selected meanwhile
+
+            labels.length = 0;
+            chartCloses.length = 0;
+            chartTimes.length = 0;
+            labels.push('');  // this label is empty for the previous day's close which is the first plotted price on chart
+            chartCloses.push(data.prevClose);
+            data.bars.forEach(add_Bar);
+            priceChart.update();
+        });
     }
 
     function load_placedOrders() {
@@ -458,18 +501,22 @@ document.addEventListener('DOMContentLoaded', function() {
                     '<td>' + order[5] + '</td>';  // Type (Buy/Sell)
 
                 // If Success is False, show loading circle
-                if (!order[6]) {
+                if (order[9]) {
+                    row += '<td>Cancelled</td>';
+                }
+                else if (!order[6]) {
                     row += '<td><div class="loading-circle"></div></td>';
                 }
                 else{
                     row += '<td>Yes</td>';
                 }
                 
-                row += '</tr>';
                 // If Rem. is greater than 0, it's an open order
-                if (order[4] > 0) {
+                if (order[4] > 0 && !order[9]) {
+                    row += '<td><button class="cancel-order-btn" data-id="' + order[0] + '">Cancel</button></td></tr>';
                     $('#open-orders-table-body').append(row);
                 } else {
+                    row += '</tr>';
                     $('#filled-orders-table-body').append(row);
                 }
             }
@@ -477,43 +524,91 @@ document.addEventListener('DOMContentLoaded', function() {
     } load_placedOrders();
 
 
-    // Listen for 'order_book' event from the server
+    // Apply the changed & removed levels (by price) to one side of the order book
+    function apply_BookDiff(side, diff, removed, ascending) {
+        var prices = new Set(removed.concat(diff.map(level => level[2])));
+        side = side.filter(level => !prices.has(level[2])).concat(diff);
+        side.sort((a, b) => ascending ? a[2] - b[2] : b[2] - a[2]);
+        return side;
+    }
+
+    // Listen for 'order_book' snapshots & deltas from the server (only sent for the selected asset)
     socket.on('order_book', function(data) {
-        // Update last known values if new data is provided
-        if (data.sym == symbol) {
-            if (data.sellOB) {
-                lastSellOB = data.sellOB;
-                sessionStorage.setItem('lastSellOB', JSON.stringify(lastSellOB));
-            }
-            if (data.buyOB) {
-                lastBuyOB = data.buyOB;
-                sessionStorage.setItem('lastBuyOB', JSON.stringify(lastBuyOB));
-            }
+        if (data.sym != symbol) return;  // left over from the previously selected asset
+
+        if (data.sellOB) {  // full snapshot
+            if (bookSeq !== null && data.seq <= bookSeq) return;  // already applied newer updates
+            lastSellOB = data.sellOB;
+            lastBuyOB = data.buyOB;
         }
-        if (data.ltp) {
-            for (let x of dataMat) {
-                if (x[1] == data.sym) {
-                    x[0] = data.ltp;
-                    break;
+        else {
+            if (bookSeq === null || data.seq != bookSeq + 1) {  // missed an update, deltas can't be applied
+                if (!bookRequested) {
+                    bookRequested = true;
+                    socket.emit('book_snapshot', { sym: symbol });
                 }
+                return;
             }
-            sessionStorage.setItem('dataMat', JSON.stringify(dataMat));
+            lastSellOB = apply_BookDiff(lastSellOB, data.sellDiff, data.sellDel, true);
+            lastBuyOB = apply_BookDiff(lastBuyOB, data.buyDiff, data.buyDel, false);
         }
+        bookSeq = data.seq;
+        bookRequested = false;
+        sessionStorage.setItem('lastSellOB', JSON.stringify(lastSellOB));
+        sessionStorage.setItem('lastBuyOB', JSON.stringify(lastBuyOB));
 
         load_OrderBook();
-        updateChart(data.sym);
+    });
+
+    // Listen for LTP changes of all assets
+    socket.on('ticker', function(data) {
+        for (let x of dataMat) {
+            if (x[1] == data.sym) {
+                x[0] = data.ltp;
+                break;
+            }
+        }
+        sessionStorage.setItem('dataMat', JSON.stringify(dataMat));
+
+        if (data.sym == symbol) load_OrderBook();  // LTP row
         load_topbar();
         load_exploreTab();
     });
 
-    // Listen for 'floorsheet' event from the server
+    // Live update of a bar of the displayed asset
+    socket.on('candle', function(data) {
+        if (data.sym != symbol || data.interval != CHART_INTERVAL) return;
+        add_Bar(data.bar);
+        priceChart.update();
+    });
+
+    // Listen for 'floorsheet' deltas (newly inserted rows only) from the server
     socket.on('floorsheet', function(data) {
-        // Update last known database if new data is provided
-        lastDatabase = data.database;
-        
-        sessionStorage.setItem('lastDatabase', JSON.stringify(lastDatabase));
+        if (floorsheetSyncing) return;  // catch-up page will cover these rows
+
+        // a delta got lost, fetch everything after the last known row
+        if (data.seq != floorsheetSeq + 1) {
+            sync_Floorsheet();
+            return;
+        }
+        floorsheetSeq = data.seq;
+        sessionStorage.setItem('floorsheetSeq', floorsheetSeq);
 
-        load_Floorsheet();
+        append_Floorsheet(data.rows);
+    });
+
+    // Listen for catch-up pages requested by sync_Floorsheet()
+    socket.on('floorsheet_page', function(data) {
+        append_Floorsheet(data.rows);
+
+        if (data.more) {
+            var lastID = lastDatabase.length ? lastDatabase[lastDatabase.length - 1].id : 0;
+            socket.emit('floorsheet_sync', { after: lastID });
+            return;
+        }
+        floorsheetSyncing = false;
+        floorsheetSeq = data.seq;
+        sessionStorage.setItem('floorsheetSeq', floorsheetSeq);
     });
 
     // Toggle between Chart, Database and Stats
@@ -545,7 +640,7 @@ document.addEventListener('DOMContentLoaded', function() {
     // Handle form submission via AJAX to avoid page reload
     $('.order-form').on('submit', function(event) {
         event.preventDefault();  // Prevent default form submission
-        var formData = $(this).serialize();  // Serialize the form data
+        var formData = $(this).serialize() + '&symbol=' + encodeURIComponent(symbol);  // Serialize the form data, for the displayed asset
         var form = $(this); // Save reference to the current form
 
         // Validate before sending AJAX request
@@ -633,7 +728,7 @@ document.addEventListener('DOMContentLoaded', function() {
         if (action == 'Sell') {
             balances[symbol] -= qty
             sessionStorage.setItem('balances', JSON.stringify(balances));
-            socket.emit('deduct_sell', { qty });
+            socket.emit('deduct_sell', { qty, sym: symbol });
         }
 
         // Submit form data via AJAX
@@ -651,6 +746,18 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // Cancel an open order (the table gets updated by the next 'placed_orders' event)
+    $('#open-orders-table-body').on('click', '.cancel-order-btn', function() {
+        $.ajax({
+            url: '/cancel_order',
+            method: 'POST',
+            data: { order_id: $(this).data('id') },
+            error: function(error) {
+                alert('Error cancelling order: ' + error.responseText);
+            }
+        });
+    });
+
     // Toggle between Limit Order and Market Execution forms
     $('#limit-order-btn').click(function() {
         $(this).addClass('active');
@@ -706,9 +813,8 @@ document.addEventListener('DOMContentLoaded', function() {
         sessionStorage.setItem('symbol', symbol);
         sessionStorage.setItem('lastSellOB', JSON.stringify(lastSellOB));
         sessionStorage.setItem('lastBuyOB', JSON.stringify(lastBuyOB));
-        sessionStorage.setItem('lastDatabase', JSON.stringify(lastDatabase));
-        sessionStorage.setItem('lastCheckTime', lastCheckTime);
-        sessionStorage.setItem('labels', JSON.stringify(labels));
+        compact_FloorsheetStore();
+        sessionStorage.setItem('floorsheetSeq', floorsheetSeq);
         sessionStorage.setItem('placedOrders', JSON.stringify(placedOrders));
     });
 });
@@ -0,0 +1,161 @@
+import csv
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+
+# a generated day (& previous day) of trades of a few symbols, in the floorsheet's CSV layout (newest first),
+# with just enough trades per symbol for it to be selected (see refine() in seperate_assets.py)
+def write_day(path, symbols=('AAA', 'BBB', 'CCC'), trades=3500):
+    rand = random.Random(1)
+    header = ['id', 'contractId', 'x', 'stockSymbol', 'buyer', 'seller', 'contractQuantity', 'contractRate',
+              'a', 'b', 'c', 'stockId', 'buyerMemberName', 'sellerMemberName', 'tradeTime', 'securityName']
+    id = 100000
+    with open(os.path.join(path, '2024-08-01'), 'w', newline='') as day, open(os.path.join(path, '2024-07-31'), 'w', newline='') as prev:
+        day, prev = csv.writer(day), csv.writer(prev)
+        day.writerow(header)
+        prev.writerow(header)
+        for stockId, sym in enumerate(symbols, 1):
+            rate, t, rows = 500.0, datetime(2024, 8, 1, 11), []
+            for _ in range(trades):
+                rate = round(rate + rand.choice([-0.1, 0, 0, 0, 0.1]), 1)
+                t += timedelta(milliseconds=rand.randint(50, 3000))
+                id += 1
+                buyer, seller = rand.sample(range(1, 60), 2)
+                rows.append([id, '2024080103' + str(id).zfill(8), '', sym, buyer, seller, rand.randint(10, 500), rate, '', '', '', stockId,
+                             f'Broker {buyer}', f'Broker {seller}', t.isoformat(timespec='microseconds'), sym + ' Ltd'])
+            day.writerows(reversed(rows))
+            prev.writerow(rows[0][:7] + [495.0] + rows[0][8:])
+    os.environ['PREV_DAY_FILE'] = os.path.join(path, '2024-07-31')
+    return os.path.join(path, '2024-08-01')
+
+
+# the engine loads the day's trades on import, a generated one stands in when they aren't available
+if not os.path.exists(os.environ.get('DAY_FILE', './data/2024-08-01')):
+    os.environ['DAY_FILE'] = write_day(tempfile.mkdtemp())
+
+import engine
+from gen_prices import genPrices
+from orderbook import OrderBook
+from publisher import book_diff
+from scheduler import Scheduler
+from trade import Trade
+
+
+# what the client does with a delta (apply_BookDiff in static/js/script.js)
+def apply_book_diff(side, diff, removed, ascending):
+    prices = set(removed) | {level[2] for level in diff}
+    side = [level for level in side if level[2] not in prices] + diff
+    side.sort(key=lambda level: level[2], reverse=not ascending)
+    return side
+
+
+def order(conID, rate, qty=10):
+    return Trade(None, conID, None, None, qty, rate, None, None, None, 'AAA')
+
+
+def test_cancelled_order_is_skipped_in_its_level():
+    book = OrderBook()
+    book.load([order('a', 100.0), order('b', 100.0)])
+    mine = order('u1', 100.0)
+    book.add(mine, 'Buy')
+    book.add(order('u2', 100.0), 'Buy')
+    assert book.cancel('u1') is mine
+    assert book.cancel('u1') is None # only once
+    assert [o.conID for o in book.level(100.0)] == ['a', 'b', 'u2']
+    assert book.counts[100.0] == 3
+
+    # the cancelled order is dropped once it reaches the front of the level
+    assert book.popleft(100.0).conID == 'a'
+    assert book.popleft(100.0).conID == 'b'
+    assert book.head(100.0).conID == 'u2'
+    assert not book.cancelled
+    assert [o.conID for o in book.head_n(100.0, 5)] == ['u2']
+
+
+def test_cancelling_last_live_order_drops_the_level():
+    book = OrderBook()
+    book.add(order('u1', 100.0), 'Sell')
+    book.add(order('u2', 100.0), 'Sell')
+    book.add(order('u3', 100.1), 'Sell')
+    book.cancel('u1')
+    assert book.prices == [100.0, 100.1]
+    book.cancel('u2')
+    assert book.prices == [100.1] and 100.0 not in book
+    assert book.head(100.0) is None and list(book.level(100.0)) == []
+    assert not book.cancelled # no leftovers of the dropped level
+
+    # a level of loaded orders goes the same way when popped empty
+    book.load([order('a', 99.9)])
+    assert book.popleft(99.9).conID == 'a'
+    assert book.prices == [100.1]
+
+
+def test_best_bid_ask_after_pop_best_and_cancel():
+    book = OrderBook()
+    assert book.best_bid is None and book.best_ask is None
+    assert book.pop_best('Buy') is None
+    for conID, rate in (('b1', 99.0), ('b2', 99.5), ('b3', 99.5), ('b4', 98.0)):
+        book.add(order(conID, rate), 'Buy')
+    for conID, rate in (('s1', 101.0), ('s2', 100.5), ('s3', 102.0)):
+        book.add(order(conID, rate), 'Sell')
+    assert (book.best_bid, book.best_ask) == (99.5, 100.5)
+
+    # time priority within the best price
+    assert book.pop_best('Buy').conID == 'b2'
+    assert book.best_bid == 99.5
+    assert book.pop_best('Buy').conID == 'b3'
+    assert book.best_bid == 99.0
+    book.cancel('b1')
+    assert book.best_bid == 98.0
+
+    book.cancel('s2')
+    assert book.best_ask == 101.0
+    assert book.pop_best('Sell').conID == 's1'
+    assert book.best_ask == 102.0
+    book.cancel('s3')
+    assert book.best_ask is None and book.pop_best('Sell') is None
+
+    # a user's order taken with popleft leaves its side too
+    assert book.popleft(98.0).conID == 'b4'
+    assert book.best_bid is None and not book.orders and not book.prices
+    assert book.bidPrices == [] and book.askPrices == []
+
+
+def test_gen_prices_levels_unique_and_sorted():
+    assert genPrices(100.1, 'asks', [100.0, 100.2, 100.3, 101.0]) == [100.3, 101.0, 102.0, 103.0, 104.0, 105.0, 106.0, 107.0, 108.0]
+
+    rand = random.Random(1)
+    for _ in range(1000):
+        prices = sorted({round(rand.uniform(90, 110), 1) for _ in range(rand.randint(0, 40))})
+        x = round(rand.uniform(90, 110), 1)
+        asks = genPrices(x, 'asks', prices)
+        bids = genPrices(x, 'bids', prices)
+        assert asks == sorted(set(asks))
+        assert bids == sorted(set(bids), reverse=True)
+
+
+def test_book_deltas_match_snapshots():
+    # every order book the engine publishes, applied as a delta on top of the previous one
+    books = {}
+    updates = 0
+
+    def order_book(obj):
+        nonlocal updates
+        sellOB = [list(level) for level in obj.sellOB]
+        buyOB = [list(level) for level in obj.buyOB]
+        sent, shown = books.get(obj.symbol, (([], []), ([], [])))
+        sellDiff, sellDel = book_diff(sent[0], sellOB)
+        buyDiff, buyDel = book_diff(sent[1], buyOB)
+        shown = (apply_book_diff(shown[0], sellDiff, sellDel, True), apply_book_diff(shown[1], buyDiff, buyDel, False))
+        assert shown == (sellOB, buyOB) # same as a fresh snapshot
+        books[obj.symbol] = ((sellOB, buyOB), shown)
+        updates += 1
+
+    engine.hooks.order_book = order_book
+    scheduler = Scheduler(0)
+    for obj in engine.assets:
+        scheduler.spawn(engine.orderMatch_sim(obj))
+    scheduler.run()
+    assert updates > 0
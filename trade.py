@@ -0,0 +1,33 @@
+class Trade():
+    # fixed attributes instead of a per-object __dict__ (or a 10-element list indexed by magic numbers)
+    __slots__ = ('id', 'conID', 'buyerID', 'sellerID', 'qty', 'rate', 'time', 'buyerName', 'sellerName', 'symbol')
+
+    def __init__(self, id, conID, buyerID, sellerID, qty, rate, time, buyerName, sellerName, symbol) -> None:
+        # contract data of a single trade (or of an order placed by the user)
+        self.id = id
+        self.conID = conID
+        self.buyerID = buyerID
+        self.sellerID = sellerID
+        self.qty = qty
+        self.rate = rate
+        self.time = time
+        self.buyerName = buyerName
+        self.sellerName = sellerName
+        self.symbol = symbol
+
+    def __repr__(self):
+        return f'<Trade {self.conID}>'
+
+    def to_dict(self):
+        """Convert the trade into PriceRow's column values."""
+        return {
+            'conID': self.conID,
+            'buyerID': self.buyerID,
+            'sellerID': self.sellerID,
+            'qty': self.qty,
+            'rate': self.rate,
+            'buyerName': self.buyerName,
+            'sellerName': self.sellerName,
+            'symbol': self.symbol,
+            'time': self.time.timestamp()
+        }
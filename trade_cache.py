@@ -0,0 +1,185 @@
+import csv
+import json
+import os
+from itertools import islice
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from trade import Trade
+
+
+# bump whenever the cached layout changes so that old caches get rebuilt
+CACHE_VERSION = 1
+
+# attributes:                     id, contractID, Buyer, Seller, Qty, Rate, Time, Buyer Name, Seller Name, Symbol
+# attribute col-index (csv file):  0,          1,     4,      5,   6,    7,   14,         12,          13,      3
+NUMERIC = {'qty': (6, np.int64), 'rate': (7, np.float64)}
+TEXT = {'id': 0, 'conID': 1}
+# repeating text columns, stored as integer codes into a vocabulary (dictionary encoding)
+CATEGORICAL = {'buyer': 4, 'seller': 5, 'buyerName': 12, 'sellerName': 13, 'symbol': 3}
+TIME = 14
+# rows parsed at a time while building the cache
+CHUNK_ROWS = 10000
+
+
+def cache_dir(path):
+    return path + '.cache'
+
+
+# parse the whole csv file in memory into compact column arrays (used when the cache can't be written)
+def parse(path):
+    columns = {name: [] for name in list(NUMERIC) + list(TEXT) + list(CATEGORICAL) + ['time']}
+    with open(path, 'r') as csv_file:
+        csv_reader = csv.reader(csv_file)
+        next(csv_reader)
+        for line in csv_reader:
+            for name, (idx, _) in NUMERIC.items():
+                columns[name].append(line[idx])
+            for name, idx in TEXT.items():
+                columns[name].append(line[idx])
+            for name, idx in CATEGORICAL.items():
+                columns[name].append(line[idx])
+            columns['time'].append(line[TIME])
+
+    arrays = {}
+    vocab = {}
+    for name, (_, dtype) in NUMERIC.items():
+        arrays[name] = np.array(columns.pop(name), dtype=dtype)
+    for name in TEXT:
+        arrays[name] = np.array(columns.pop(name), dtype=np.bytes_)
+    for name in CATEGORICAL:
+        values, codes = np.unique(np.array(columns.pop(name)), return_inverse=True)
+        arrays[name] = codes.astype(np.int32)
+        vocab[name] = values.tolist()
+    arrays['time'] = np.array(columns.pop('time'), dtype='datetime64[us]') # ISO-8601 strings, with or without fraction of seconds
+    return arrays, vocab
+
+
+# first pass: no. of rows & the widest value of each text column
+def scan(path):
+    n = 0
+    widths = {name: 1 for name in TEXT}
+    with open(path, 'r') as csv_file:
+        csv_reader = csv.reader(csv_file)
+        next(csv_reader)
+        for line in csv_reader:
+            n += 1
+            for name, idx in TEXT.items():
+                if len(line[idx]) > widths[name]:
+                    widths[name] = len(line[idx])
+    return n, widths
+
+
+# chunks of up to CHUNK_ROWS rows, as lists of raw values per column (the rest of each line is dropped right away)
+def read_chunks(path):
+    names = list(NUMERIC) + list(TEXT) + list(CATEGORICAL) + ['time']
+    indexes = [NUMERIC[name][0] for name in NUMERIC] + list(TEXT.values()) + list(CATEGORICAL.values()) + [TIME]
+    with open(path, 'r') as csv_file:
+        csv_reader = csv.reader(csv_file)
+        next(csv_reader)
+        while True:
+            chunk = {name: [] for name in names}
+            columns = [chunk[name] for name in names]
+            for line in islice(csv_reader, CHUNK_ROWS):
+                for column, idx in zip(columns, indexes):
+                    column.append(line[idx])
+            if not chunk['time']:
+                return
+            yield chunk
+
+
+# second pass: parse the csv file chunk by chunk straight into the cache's .npy files,
+# so that memory use is bounded by the chunk size and not by the size of the day file
+def build_cache(path):
+    n, widths = scan(path)
+    directory = cache_dir(path)
+    os.makedirs(directory, exist_ok=True)
+
+    dtypes = {name: dtype for name, (_, dtype) in NUMERIC.items()}
+    dtypes.update({name: f'S{widths[name]}' for name in TEXT})
+    dtypes.update({name: np.int32 for name in CATEGORICAL})
+    dtypes['time'] = 'datetime64[us]'
+    arrays = {name: open_memmap(os.path.join(directory, name + '.npy'), mode='w+', dtype=dtype, shape=(n,)) for name, dtype in dtypes.items()}
+    codes = {name: {} for name in CATEGORICAL} # value -> code, in order of first appearance
+
+    start = 0
+    for chunk in read_chunks(path):
+        stop = start + len(chunk['time'])
+        for name in list(NUMERIC) + list(TEXT) + ['time']:
+            arrays[name][start:stop] = np.array(chunk[name], dtype=dtypes[name]) # ISO-8601 times, with or without fraction of seconds
+        for name in CATEGORICAL:
+            mapping = codes[name]
+            arrays[name][start:stop] = [mapping.setdefault(value, len(mapping)) for value in chunk[name]]
+        start = stop
+
+    for array in arrays.values():
+        array.flush()
+    del arrays
+    vocab = {name: list(mapping) for name, mapping in codes.items()}
+    write_meta(path, vocab)
+
+
+def write_meta(path, vocab):
+    stat = os.stat(path)
+    meta = {'version': CACHE_VERSION, 'mtime': stat.st_mtime, 'size': stat.st_size, 'vocab': vocab}
+    # meta is written last, a half written cache is never taken as valid
+    with open(os.path.join(cache_dir(path), 'meta.json'), 'w') as file:
+        json.dump(meta, file)
+
+
+def read_cache(path):
+    directory = cache_dir(path)
+    try:
+        with open(os.path.join(directory, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    stat = os.stat(path)
+    if meta.get('version') != CACHE_VERSION or meta.get('mtime') != stat.st_mtime or meta.get('size') != stat.st_size:
+        return None # source file changed since the cache was built
+
+    arrays = {}
+    for name in list(NUMERIC) + list(TEXT) + list(CATEGORICAL) + ['time']:
+        arrays[name] = np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+    return arrays, meta['vocab']
+
+
+# columns of the day's trades, memory-mapped from the cache (built on first use)
+def load_day(path):
+    cached = read_cache(path)
+    if cached is not None:
+        return cached
+    try:
+        build_cache(path)
+        return read_cache(path)
+    except OSError as e:
+        print(f"Error: {str(e)}") # cache can't be written, parse the whole file in memory instead
+        return parse(path)
+
+
+# [start, stop) row ranges of each symbol, in file order (rows of a symbol are contiguous)
+def symbol_ranges(arrays):
+    codes = arrays['symbol']
+    if len(codes) == 0:
+        return []
+    bounds = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    starts = [0] + bounds.tolist()
+    stops = bounds.tolist() + [len(codes)]
+    return list(zip(starts, stops))
+
+
+# rebuild the trades of rows [start, stop)
+def rows(arrays, vocab, start, stop):
+    decoded = {}
+    for name in TEXT:
+        decoded[name] = np.char.decode(arrays[name][start:stop]).tolist()
+    for name in CATEGORICAL:
+        values = vocab[name]
+        decoded[name] = [values[code] for code in arrays[name][start:stop].tolist()] # every row shares the vocabulary's str objects
+    qty = arrays['qty'][start:stop].tolist()
+    rate = arrays['rate'][start:stop].tolist()
+    time = arrays['time'][start:stop].astype(object).tolist() # datetime.datetime objects
+
+    return [Trade(*row) for row in zip(decoded['id'], decoded['conID'], decoded['buyer'], decoded['seller'], qty, rate, time, decoded['buyerName'], decoded['sellerName'], decoded['symbol'])]
@@ -8,7 +8,7 @@ class User:
         self.username = username
         self.password = password
         self.name = name 
-        self.balance = {asset.arr[0][9]: 100000 for asset in assets} # for demo-user, using 10,000 shares as their balance for each asset in the market
+        self.balance = {asset.symbol: 100000 for asset in assets} # for demo-user, using 10,000 shares as their balance for each asset in the market
         self.collateral = 1000000.00 # for demo-user, 10 lakhs as their purchasing power
         self.is_admin = is_admin
 
@@ -1,103 +1,79 @@
-from seperate_assets import allSymbols, prevDay
+from seperate_assets import allSymbols, columns, symbol_at, trades, prev_day
+from orderbook import OrderBook
 
+import os
 import threading
+from collections import deque
 
 
 # contain objects, each obj represent a particular asset
 assets = []
+# symbol -> obj of the same assets, for O(1) lookups
+registry = {}
 # total no. of top buy/sell orders to display in order book
 TOP_BIDSASKS_NO = 9
-# OrderID of placed orders by user
-Orders = 0
-# all existing MKT orders' OrderID
-MKT_Orders = []
-# all types of orders placed by user
-placedOrders = []
+# build every asset's data structures in background right after start-up (otherwise on first use)
+PREWARM_ASSETS = False
+# every n-th order book update of an asset is sent in full, the others only carry the changed levels
+BOOK_SNAPSHOT_EVERY = 100
+# replay speed multiplier of the simulation: 1 is real-time, 10 is ten times faster, 0 is as fast as possible
+SIM_SPEED = float(os.environ.get('SIM_SPEED', 1))
+# this process simulates every SHARD_COUNT-th asset starting at SHARD_INDEX only (set for the worker processes of shard.py)
+SHARD_INDEX, SHARD_COUNT = map(int, os.environ.get('SHARD', '0/1').split('/'))
+# last OrderID given to an order placed by user (strided across shards, so contractIDs stay unique)
+Orders = SHARD_INDEX
+# all types of orders placed by user: OrderID -> order
+placedOrders = {}
+# held while placedOrders gets a new order or is iterated, and while Orders is incremented (orders are placed from other threads)
+lock_orders = threading.Lock()
 # default symbol to display
 symbol = None
 # datecode in conID
 datecode = None
-# specific locks for each object
-lock_orderPlacing = []
 
 
-# attributes:                        OrderNo, Symbol, Qty, Rate, Remaining Qty, Type, Sucess_on_placing
-# attribute col-index (placedOrders):      0,      1,   2,    3,             4,    5,                 6
+# attributes:                        OrderNo, Symbol, Qty, Rate, Remaining Qty, Type, Sucess_on_placing, Username, Name, Cancelled
+# attribute col-index (placedOrders):      0,      1,   2,    3,             4,    5,                 6,        7,    8,         9
 
 
 class AssetData():
-    def __init__(self, arr) -> None:
-        # extracted data (orders) of this asset, used to simulate supply-demand
-        self.arr = arr[::-1]
-        # list to store unique prices in sorted manner
-        self.prices = [el[5] for el in self.arr]
-        # list of buy/sell orders lists sorted on basis of price-time
-        self.queue = []
+    def __init__(self, rows, id) -> None:
+        # stable no. of the asset: its position among all selected symbols (same in every shard)
+        self.id = id
+        self.symbol = symbol_at(rows[0])
+        # [start, stop) rows of its trades in the day's columns
+        self.rows = rows
+        # extracted data (orders) of this asset, used to simulate supply-demand (built by load())
+        self.arr = []
+        # buy/sell orders sorted on basis of price-time, along with the sorted unique prices
+        self.book = OrderBook()
         # prev. day closing price
         self.prevClose = None
         # security's name
         self.name = None
         # order book for top bid & ask prices
         self.buyOB = []; self.sellOB = []
-        # total no. of sub-threads in existance
-        self.subThreads = 0 
-        # while waiting for main thread to be halted
-        self.event_start_subThread = threading.Event()
-        # while LMT order is being placed
-        self.event_place_LMT = threading.Event()
-        # when main-thread is not waiting
-        self.skip = False
+        # commands for this asset: ('place', OrderNo) of LMT orders, ('market', OrderNo) of MKT orders,
+        # ('cancel', OrderNo) & ('amend', OrderNo, Qty, Rate), applied in one batch by the asset's own task between ticks
+        # (the only writer of its data structures)
+        self.inbox = deque()
+        # user's LMT orders resting in the book: contractID -> OrderNo
+        self.orderNos = {}
+        # MKT orders of this asset waiting to be filled (OrderNo), oldest first
+        self.mktOrders = deque()
         # market execution mode
         self.mkt_ex_mode = False
+        # last traded price sent on the ticker
+        self.ltp = None
+        # random [orders, qty] shown at ask/bid prices without any queued order, kept while the price stays in the order book
+        self.fillers = ({}, {})
+        # (sequence no., (sellOB, buyOB)) of the order book update last sent to the clients, replaced as a whole
+        # so a snapshot taken on another thread always pairs a book with its own seq
+        self.publishedOB = (0, ([], []))
+        # whether the order book has been built (done lazily, see load())
+        self.loaded = False
+        self.lock_load = threading.Lock()
 
-        # attributes:               id, contractID, Buyer, Seller, Qty, Rate, Time, Buyer Name, Seller Name, Symbol
-        # attribute col-index (arr): 0,          1,     2,      3,   4,    5,    6,          7,           8,      9
-
-        self.load_PrevClose()
-        self.load_dataStructs()
-
-
-    @staticmethod
-    def radixSort(arr):
-        # Convert floats to integers by scaling
-        scale_factor = 10 ** max(len(str(price).split('.')[1]) if '.' in str(price) else 0 for price in arr)
-        int_arr = [int(price * scale_factor) for price in arr]
-
-        # Perform radix sort on the integer array
-        max_val = max(int_arr)
-        exp = 1
-        while max_val // exp > 0:
-            AssetData.counting_sort(int_arr, exp)
-            exp *= 10
-
-        # Convert back to floats
-        sorted_arr = [price / scale_factor for price in int_arr]
-        return sorted_arr
-
-    @staticmethod
-    def counting_sort(arr, exp):
-        n = len(arr)
-        output = [0] * n
-        count = [0] * 10
-
-        # Count occurrences of each digit
-        for i in range(n):
-            index = (arr[i] // exp) % 10
-            count[index] += 1
-
-        # Update count[i] to be the actual position in output
-        for i in range(1, 10):
-            count[i] += count[i - 1]
-
-        # Build the output array
-        for i in range(n - 1, -1, -1):
-            index = (arr[i] // exp) % 10
-            output[count[index] - 1] = arr[i]
-            count[index] -= 1
-
-        # Copy output array to arr
-        for i in range(n):
-            arr[i] = output[i]
 
     @staticmethod
     def remove_duplicates(lst):
@@ -110,35 +86,46 @@ class AssetData():
         return unique_list
 
 
+    # group orders by price in one pass, queue entries are the same rows as in arr (not copies)
     def createQueue(self):
-        for price in self.prices:
-            temp = []
-            for x in self.arr:
-                if(price == x[5]):
-                    temp.append([x[0], x[1], x[2], x[3], x[4], x[5], x[6], x[7], x[8], x[9]])
-            self.queue.append(temp)
+        self.book.load(self.arr)
 
 
     # extracting prev. closing price of the security
     def load_PrevClose(self):
         # attributes:                      stockId, Symbol, securityName, Rate
         # attribute col-index (prevDay):         0,      1,            2,    3
-        for line in prevDay:
-            if(line[1] == self.arr[0][9]):
-                self.prevClose = line[3]
-                self.name = line[2]
-                break
+        line = prev_day().get(self.symbol)
+        if line is not None:
+            self.prevClose = line[3]
+            self.name = line[2]
 
 
     def load_dataStructs(self):
-        self.prices = self.remove_duplicates(self.radixSort(self.prices)) # sort the prices and remove duplicates
+        self.arr = trades(*self.rows)[::-1]
         self.createQueue()
+        self.load_PrevClose()
+
+
+    # build the trades & order book on first use: when the asset gets selected or its simulation starts
+    def load(self):
+        with self.lock_load:
+            if not self.loaded:
+                self.load_dataStructs()
+                self.loaded = True
+
+
+# build all assets' order books ahead of their first use
+def prewarm():
+    for asset in assets:
+        asset.load()
 
 
 print("Creating Objects ...")
 for i, sec in enumerate(allSymbols):
-    assets.append(AssetData(sec))
-    lock_orderPlacing.append(threading.Lock())
+    if i % SHARD_COUNT == SHARD_INDEX:
+        assets.append(AssetData(sec, i))
+        registry[assets[-1].symbol] = assets[-1]
     
-datecode = assets[0].arr[0][1][:8]
-symbol = assets[len(assets)-1].arr[0][9]
+datecode = columns['conID'][allSymbols[0][0]][:8].decode()
+symbol = symbol_at(allSymbols[-1][0])
@@ -1,5 +1,6 @@
-from flask import Flask, render_template
+from flask import Flask, render_template, request
 from flask_sqlalchemy import SQLAlchemy
+from floorsheet import floorsheet_indexes, create_indexes, page, page_args
 
 # App setups
 app = Flask(__name__)
@@ -20,6 +21,8 @@ class PriceRow(db.Model):
     buyerName = db.Column(db.String(100))
     sellerName = db.Column(db.String(100))
     symbol = db.Column(db.String(10))
+
+    __table_args__ = floorsheet_indexes()
     
     def __repr__(self):
         return f'<Task {self.id}>'
@@ -38,16 +41,22 @@ class PriceRow(db.Model):
             'symbol': self.symbol
         }
 
-# Route to display the data
+# Route to display the data, a page at a time (same filters as /api/floorsheet)
 @app.route('/')
 def index():
-    tranData = PriceRow.query.order_by(PriceRow.id).all() # query to get all data from the database
-    return render_template('viewDB.html', database=tranData)
+    try:
+        after, limit = page_args(request.args)
+        tranData, more = page(PriceRow, request.args, after, limit)
+    except ValueError as e:
+        return str(e), 400
+    args = {k: v for k, v in request.args.items() if k != 'after'}
+    return render_template('viewDB.html', database=tranData, next=tranData[-1]['id'] if more else None, args=args)
 
 if __name__ == "__main__":
     # Ensure tables are created
     with app.app_context():
         db.create_all()
+        create_indexes(PriceRow, db.engine)
 
     # Start the Flask app
     app.run(debug=True)
\ No newline at end of file